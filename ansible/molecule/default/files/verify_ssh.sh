@@ -14,9 +14,9 @@ hpnssh \
 sudo -u borg mkdir -p /home/borg/tamborgcont/
 
 # Test hook deny/allow on borg user:
-sudo -u borg ln -sf /bin/false /home/borg/tamborgcont/hook.sh
+sudo -u borg ln -sf /bin/false /home/borg/tamborgcont/hook_client.sh
 (! hpnssh -oBatchMode=yes -p1701 borg@localhost true)
-sudo -u borg ln -sf /bin/true /home/borg/tamborgcont/hook.sh
+sudo -u borg ln -sf /bin/true /home/borg/tamborgcont/hook_client.sh
 hpnssh -oBatchMode=yes -p1701 borg@localhost true
 
 # Test hook deny on plain ssh for borg user:
@@ -40,9 +40,10 @@ if [[ "$PAM_USER" == "borg" ]]; then
     echo "Please use hpnssh."
     exit 1
   elif [[ "$PAM_TYPE" == "open_session" || "$PAM_TYPE" == "close_session" ]]; then
-    sudo --login -u borg \
+    # No --login: the client talks to tamborg-hook.service, and only falls back to a login shell if it's down.
+    sudo -u borg \
       PAM_TYPE="$PAM_TYPE" \
       SSH_AUTH_INFO_0="$SSH_AUTH_INFO_0" \
-      /home/borg/tamborgcont/hook.sh pam
+      /home/borg/tamborgcont/hook_client.sh
   fi
 fi
@@ -0,0 +1,76 @@
+'''
+Weekly `borg check`.
+
+With check_weeks: 1, it's a full `borg check --verify-data`, which reads the whole repo.
+
+With check_weeks: N, every week `borg check --archives-only` checks the archives' metadata, reading only its chunks,
+and the segments are deep-verified in N slots, one per week: slot k is the segments with number % N == k.
+Deep-verifying reads a segment, and verifies its objects' CRCs, and their MACs and ids by decrypting them
+(see shared/verify_segments.py). So every segment is verified at least once every N weeks,
+and each week reads about 1/N of the repo, plus the new data.
+The repository index isn't compared with the segments, because that needs `borg check --repository-only`,
+which reads them all.
+
+Segments new or changed since they were last verified are deep-verified too, regardless of their slot.
+Segments are append-only and written once, so a changed (ino, mtime, size) means something is wrong,
+and new ones are the week's backups. Everything is verified on the first run, which has no fingerprints.
+
+The state is saved in state/<repo>/check.json only when a check succeeds, so a failed one is retried.
+'''
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING
+
+from shared.utils import read_json_state, write_json_state
+
+if TYPE_CHECKING:
+    from logging import Logger
+
+    from shared.borg_lib import LibBorg
+    from shared.config import RepoConfig
+    from shared.constants import Paths
+    from shared.shell import Borg
+
+
+def weekly_check(borg: Borg | LibBorg, paths: Paths, config: RepoConfig, logger: Logger):
+    def on_output_line(line: str):
+        logger.debug(f'borg check: {line}')
+
+    if config.check_weeks == 1:
+        borg.check(on_output_line)
+        return
+
+    state = read_json_state(paths.check_state)
+    slot = state.get('next_slot', 0) % config.check_weeks
+
+    fingerprints = segment_fingerprints(paths)
+    last_verified = state.get('verified', {})
+    changed = {int(s) for s, fp in fingerprints.items() if last_verified.get(s) != fp}
+    to_verify = changed | {int(s) for s in fingerprints if int(s) % config.check_weeks == slot}
+
+    borg.check(on_output_line, archives_only=True)
+    verified = borg.verify_segments(to_verify)
+    logger.debug(
+        f'Deep-verified {verified} segments: slot {slot}/{config.check_weeks}, '
+        f'plus {len(changed)} new or changed, out of {len(fingerprints)}'
+    )
+
+    state['next_slot'] = (slot + 1) % config.check_weeks
+    state['verified'] = fingerprints
+    write_json_state(paths.check_state, state)
+
+
+def segment_fingerprints(paths: Paths):
+    """{segment number (str, for JSON): [ino, mtime_ns, size]} of the files in data/<dir>/<segment>"""
+    fingerprints = {}
+    with os.scandir(paths.repo_data) as dirs:
+        for d in dirs:
+            if not d.is_dir(follow_symlinks=False):
+                continue
+            with os.scandir(d.path) as files:
+                for f in files:
+                    if f.name.isdigit():
+                        st = f.stat(follow_symlinks=False)
+                        fingerprints[f.name] = [st.st_ino, st.st_mtime_ns, st.st_size]
+    return fingerprints
@@ -0,0 +1,91 @@
+'''
+Chooses the threshold of the weekly `borg compact`, with compaction_max_rewrite_gb.
+
+Compacting a segment writes its live data to a new segment, which is a new file for the mirror:
+it's transferred again, and kept twice there until the checked copy moves on.
+So, rewriting many barely-sparse segments costs more mirror traffic than the disk space it frees.
+
+The repo's hints.N file has borg's 'compact' map: freeable bytes of each segment, which borg compact
+compares with the segment's size (`freeable / size > threshold%`). This picks the lowest threshold,
+not lower than compaction_threshold, whose segments add up to at most compaction_max_rewrite_gb of live data.
+So the sparsest segments are compacted first, and the rest wait for later weeks when more of them is freeable.
+
+Reading hints needs msgpack, which comes with borgbackup (importable with borg_backend: library).
+If it's not importable, or hints can't be read, compaction_threshold is used as is.
+'''
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from daily.check import segment_fingerprints
+
+if TYPE_CHECKING:
+    from logging import Logger
+    from pathlib import Path
+
+    from shared.config import RepoConfig
+    from shared.constants import Paths
+
+GB = 1000**3
+
+
+@dataclass(frozen=True)
+class CompactionPlan:
+    threshold: int | None  # None: nothing worth compacting within the cap
+    segments: int
+    freed: int
+    rewritten: int
+
+
+def read_compact_hints(repo: Path) -> dict[int, int]:
+    """{segment: freeable bytes}, from the latest hints.N. Raises ImportError or OSError/ValueError."""
+    import msgpack  # Optional, see above
+
+    hints_files = [p for p in repo.glob('hints.*') if p.suffix[1:].isdigit()]
+    if not hints_files:
+        msg = f'No hints file in {repo}'
+        raise FileNotFoundError(msg)
+    latest = max(hints_files, key=lambda p: int(p.suffix[1:]))
+    with latest.open('rb') as f:
+        hints = msgpack.unpack(f, raw=False, strict_map_key=False)
+    if hints.get('version') != 2:
+        msg = f'Unsupported hints version in {latest}: {hints.get("version")!r}'
+        raise ValueError(msg)
+    return {int(segment): freeable for segment, freeable in hints['compact'].items()}
+
+
+def plan_compaction(freeable: dict[int, int], sizes: dict[int, int], min_threshold: int, max_rewrite: int):
+    for threshold in range(min_threshold, 100):
+        selected = [
+            s for s, free in freeable.items()
+            if sizes.get(s) and free / sizes[s] > threshold / 100
+        ]
+        rewritten = sum(sizes[s] - freeable[s] for s in selected)
+        if rewritten <= max_rewrite:
+            if not selected:
+                break
+            return CompactionPlan(threshold, len(selected), sum(freeable[s] for s in selected), rewritten)
+    return CompactionPlan(None, 0, 0, 0)
+
+
+def compaction_threshold(paths: Paths, config: RepoConfig, logger: Logger):
+    """Returns the threshold for `borg compact`, or None to skip it."""
+    if config.compaction_max_rewrite_gb is None:
+        return config.compaction_threshold
+    try:
+        freeable = read_compact_hints(paths.repo)
+    except (ImportError, OSError, ValueError, KeyError) as e:
+        logger.warning(f'Using compaction_threshold, could not read compaction hints: {e!r}')
+        return config.compaction_threshold
+
+    sizes = {int(s): fp[2] for s, fp in segment_fingerprints(paths).items()}
+    plan = plan_compaction(freeable, sizes, config.compaction_threshold, config.compaction_max_rewrite_gb * GB)
+    if plan.threshold is None:
+        logger.debug(f'Nothing to compact under compaction_max_rewrite_gb={config.compaction_max_rewrite_gb}')
+    else:
+        logger.debug(
+            f'Compaction plan: threshold {plan.threshold}%, {plan.segments} segments, '
+            f'frees {plan.freed / GB:.1f} GB, rewrites {plan.rewritten / GB:.1f} GB'
+        )
+    return plan.threshold
@@ -0,0 +1,98 @@
+'''
+Healthchecks.io pings, sent in order by a background thread over a pooled session, so they don't block the run.
+
+If a ping fails (for example, the uplink is down), it and all the following ones are kept in order
+in state/hc_outbox.json, and sent first on the next run. Pings older than OUTBOX_MAX_AGE are dropped.
+'''
+from __future__ import annotations
+
+import queue
+import time
+from threading import Lock, Thread
+from typing import TYPE_CHECKING
+
+import requests
+
+from daily.utils import logger
+from shared.constants import Paths
+from shared.utils import read_json_state, write_json_state
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+TIMEOUT = 10
+CLOSE_TIMEOUT = 30  # To wait for pending pings when the run finishes
+OUTBOX_MAX_AGE = 7 * 24 * 3600
+
+
+class Healthchecks:
+    def __init__(self, outbox: Path = Paths.hc_outbox):
+        self.outbox = outbox
+        self.session = requests.Session()
+        self.queue: queue.Queue[dict | None] = queue.Queue()
+        self.lock = Lock()
+        self.undelivered: list[dict] = []
+        self.in_flight: dict | None = None
+        self.thread: Thread | None = None
+
+    def ping(self, url: str, data: str | None = None):
+        """Doesn't block."""
+        with self.lock:
+            if self.thread is None:
+                self._start()
+            self.queue.put({'url': url, 'data': data, 'time': time.time()})
+
+    def _start(self):
+        replay = read_json_state(self.outbox).get('pings', [])
+        for entry in replay:
+            if time.time() - entry['time'] < OUTBOX_MAX_AGE:
+                self.queue.put(entry)
+        if replay:
+            logger.debug(f'Replaying {len(replay)} undelivered healthcheck pings')
+        self.thread = Thread(target=self._worker, name='healthchecks', daemon=True)
+        self.thread.start()
+
+    def _worker(self):
+        failed = False
+        while (entry := self.queue.get()) is not None:
+            if failed:
+                # Not sent, so they're replayed in order
+                self.undelivered.append(entry)
+                continue
+            with self.lock:
+                self.in_flight = entry
+            try:
+                r = self.session.post(entry['url'], data=entry['data'], timeout=TIMEOUT)
+                r.raise_for_status()
+            except requests.RequestException as e:
+                logger.error(f'Healthcheck failed, will retry on the next run: {e}')
+                failed = True
+                self.undelivered.append(entry)
+            with self.lock:
+                self.in_flight = None
+
+    def close(self, timeout: float = CLOSE_TIMEOUT):
+        """Waits for pending pings, and saves the undelivered ones for the next run."""
+        with self.lock:
+            thread = self.thread
+            if thread is None:
+                return
+            self.queue.put(None)
+        thread.join(timeout)
+
+        with self.lock:
+            pending = list(self.undelivered)
+            if thread.is_alive():
+                # Still trying to send. It may be delivered twice, which is better than never.
+                if self.in_flight:
+                    pending.append(self.in_flight)
+                while not self.queue.empty():
+                    entry = self.queue.get_nowait()
+                    if entry is not None:
+                        pending.append(entry)
+            self.thread = None
+        write_json_state(self.outbox, {'pings': pending})
+        self.session.close()
+
+
+healthchecks = Healthchecks()
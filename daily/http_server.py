@@ -1,39 +1,53 @@
 """
-`waiting_for` is served from a python http server.
+`waiting_for` is served from a python http server, for LAN clients. The hook reads it from a file instead,
+see shared/waiting_for.py.
 
 Another way of serving it is with nginx and a static file, but then stale data could be served.
 Instead, when the python process ends, no waiting_for will be served.
 """
+from __future__ import annotations
 
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from threading import Thread
+import asyncio
+import contextlib
 
+PORT = 8087
+REQUEST_TIMEOUT = 5
 
-class WaitingForHandler(BaseHTTPRequestHandler):
-    def do_GET(self):  # noqa: N802
-        waiting_for = self.server.repo_waiting.get(self.path.lstrip('/'))
-        if waiting_for:
-            self.send_response_only(200)
-            self.end_headers()
-            self.wfile.write(waiting_for.encode('utf-8'))
-        else:
-            self.send_response_only(404)
-            self.end_headers()
 
-    def log_message(self, *args):
-        pass  # Discard
+class HttpServer:
+    """Minimal HTTP/1.0 server on borg-daily's event loop. It only answers GET /<repo>."""
 
+    def __init__(self, port: int = PORT):
+        self.port = port
+        self.repo_waiting: dict[str, str] = {}
+        self.server: asyncio.Server | None = None
 
-class HttpServer(Thread):
-    def __init__(self):
-        super().__init__(daemon=True, name='HttpServerThread')
-
+    async def __aenter__(self):
         # Accessible from LAN. Assumes noone will DoS it. Not to be exposed to internet.
         host = '0.0.0.0'
-        self.server = HTTPServer((host, 8087), WaitingForHandler)
-
-        self.repo_waiting = self.server.repo_waiting = {}
-        self.start()
-
-    def run(self):
-        self.server.serve_forever()
+        self.server = await asyncio.start_server(self.handle, host, self.port)
+        return self
+
+    async def __aexit__(self, *_exc_info):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            async with asyncio.timeout(REQUEST_TIMEOUT):
+                request_line = await reader.readline()
+                while (await reader.readline()).strip():
+                    pass  # Discard headers
+            method, path, *_version = request_line.decode('latin-1').split(' ')
+            waiting_for = self.repo_waiting.get(path.lstrip('/')) if method == 'GET' else None
+            if waiting_for:
+                writer.write(b'HTTP/1.0 200 OK\r\n\r\n' + waiting_for.encode('utf-8'))
+            else:
+                writer.write(b'HTTP/1.0 404 Not Found\r\n\r\n')
+            await writer.drain()
+        except (TimeoutError, ValueError, OSError):
+            pass  # Bad client, discard
+        finally:
+            writer.close()
+            with contextlib.suppress(OSError):
+                await writer.wait_closed()
@@ -1,17 +1,26 @@
 from __future__ import annotations
 
+import asyncio
 import shutil
 import sys
-from contextlib import contextmanager, suppress
 from datetime import datetime
 from typing import TYPE_CHECKING
 
 import sh
 import wakeonlan
 
+from daily.check import weekly_check
+from daily.compaction import compaction_threshold
+from daily.healthcheck import healthchecks
 from daily.http_server import HttpServer
+from daily.mirror_manifest import MirrorManifest, local_files, plan
+from daily.prune import parse_archives, plan_prune, to_delete
+from daily.scheduler import DeviceScheduler
+from daily.scrub import MirrorScrub
+from daily.segment_hashes import SegmentHashes
 from daily.smarthealthc import smarthealthc
-from daily.utils import JoinRaiseThread, hc_ping
+from daily.utils import gather_raise, to_thread_cm
+from shared.borg_lib import LibBorg, LibBorgError
 from shared.config import (
     get_config,
     get_config_repos,
@@ -20,10 +29,17 @@ from shared.constants import Paths
 from shared.pubsub import PubSub
 from shared.shell import Borg, Mirror
 from shared.utils import LoggerPurpose, get_logger, mkdir_lock
+from shared.waiting_for import write_waiting_for
 
 if TYPE_CHECKING:
     from pathlib import Path
 
+    from shared.config import UserConfig
+
+
+# Users woken and ssh-triggered at the same time, per repo
+TRIGGER_CONCURRENCY = 4
+
 
 def get_is_weekly():
     TUESDAY = 1
@@ -32,40 +48,42 @@ def get_is_weekly():
     if now.weekday() == TUESDAY:
         return True
 
-    force_until = get_config().get('force_weekly_until')
-    if force_until:
-        if isinstance(force_until, str):
-            force_until = datetime.fromisoformat(force_until).date()
-        if now.date() <= force_until:
-            return True
-
-    return False
+    force_until = get_config().force_weekly_until
+    return bool(force_until) and now.date() <= force_until
 
 
 def main():
-    hc_url = get_config()['weekly_healthcheck']
+    try:
+        asyncio.run(run_daily())
+    finally:
+        healthchecks.close()
+
+
+async def run_daily():
+    '''
+    Everything runs as tasks on one event loop. Blocking sh calls go to threads with asyncio.to_thread,
+    and seek-heavy ones also hold their devices in the DeviceScheduler.
+    '''
+    hc_url = get_config().weekly_healthcheck
     is_weekly = get_is_weekly()
 
     def weekly_ping(action: str, data: str | None = None):
         if is_weekly:
-            hc_ping(f'{hc_url}/{action}', data)
+            healthchecks.ping(f'{hc_url}/{action}', data)
 
     weekly_ping('start')
     try:
-        http_server = HttpServer()
-        threads: list[ProcessRepo] = []
-
-        # Assume each repo is on separate hardisk and can be processed in parallel:
-        for repo in get_config_repos():
-            t = ProcessRepo(repo, http_server, is_weekly=is_weekly)
-            t.start()
-            threads.append(t)
-
-        smarthealthc()
-        tamborgmatic_fetch()
-
-        for t in threads:
-            t.join_raise()
+        async with HttpServer() as http_server:
+            scheduler = DeviceScheduler()
+            repos = [
+                ProcessRepo(repo, http_server, scheduler, is_weekly=is_weekly)
+                for repo in get_config_repos()
+            ]
+            await gather_raise(
+                *(r.run() for r in repos),
+                smarthealthc(),
+                asyncio.to_thread(tamborgmatic_fetch),
+            )
 
     except Exception as e:
         weekly_ping('fail', str(e))
@@ -74,28 +92,42 @@ def main():
         weekly_ping('0')  # Success
 
 
-class ProcessRepo(JoinRaiseThread):
-    def __init__(self, repo: str, http_server: HttpServer, *, is_weekly: bool):
-        logger = get_logger(repo, LoggerPurpose.DAILY)
-        super().__init__(repo, logger)
+class ProcessRepo:
+    def __init__(self, repo: str, http_server: HttpServer, scheduler: DeviceScheduler, *, is_weekly: bool):
         self.repo = repo
-        self.logger = logger
+        self.logger = get_logger(repo, LoggerPurpose.DAILY)
+        self.scheduler = scheduler
         self.is_weekly = is_weekly
         self.paths = Paths(repo)
-        self.borg = Borg(self.paths)
-        self.pubsub = PubSub(self.paths, start=True)
-
-        mirror_host = get_config()['repos'][repo].get('mirror_host')
-        self.mirror = Mirror(mirror_host) if mirror_host else None
+        self.config = get_config().repos[repo]
+        if self.config.borg_backend == 'library':
+            self.borg = LibBorg(self.paths)
+        else:
+            self.borg = Borg(self.paths)
+        self.mirror = Mirror(self.config.mirror_host) if self.config.mirror_host else None
+        self.mirror_manifest = MirrorManifest(self.paths)
+        self.device = self.config.device or f'repo:{repo}'
+        self.mirror_device = self.config.mirror_device or f'mirror:{self.config.mirror_host}'
 
         def set_waiting_for(user: str | None):
+            # The file is for the hook, and the http server for LAN clients
+            write_waiting_for(self.paths, user)
             if user:
                 http_server.repo_waiting[repo] = user
             else:
                 http_server.repo_waiting.pop(repo, None)
         self.set_waiting_for = set_waiting_for
 
-    def _run(self):
+    async def run(self):
+        try:
+            await self._run_repo()
+        except Exception:
+            self.logger.exception('')
+            raise
+        finally:
+            await asyncio.to_thread(self.borg.close)
+
+    async def _run_repo(self):
         if not self.paths.repo_enabled.exists():
             self.logger.debug('Repo is disabled')
             return
@@ -103,90 +135,141 @@ class ProcessRepo(JoinRaiseThread):
             msg = f'Lock is taken by {self.paths.lock_user.read_text()}'
             raise RuntimeError(msg)
 
-        auto_users = (u for u in get_config()['users'] if u['repo'] == self.repo and u.get('ssh'))
+        # Read now, instead of by the first borg command while holding the repo device:
+        await self.scheduler.run([get_config().env_device], self.borg.passphrase)
+
+        auto_users = get_config().repo_auto_users.get(self.repo, [])
         try:
-            for user in auto_users:
-                self.run_user(user)
+            await self.run_users(auto_users)
 
             if self.is_weekly:
                 self.set_waiting_for('run_weekly')
-                self.run_weekly()
+                await self.run_weekly()
             else:
                 self.set_waiting_for(None)
                 if self.mirror:
-                    self.rsync_current(link_dest=self.mirror.CURRENT)
+                    await self.rsync_current(link_dest=self.mirror.CURRENT)
         finally:
             self.set_waiting_for(None)
 
-    def run_user(self, user):
-        self.logger.debug(f'{user['user']}: waiting_for')
-        self.set_waiting_for(user['user'])
+    async def run_users(self, auto_users: list[UserConfig]):
+        '''
+        Wakes and triggers all users up front, so that they boot and run hooks.sh in parallel.
+        Then the repo is granted to them one at a time, in order, with waiting_for.
+        Meanwhile, the hook denies the other users and their tamborgmatic retries.
+        '''
+        if not auto_users:
+            return
+        # A subscriber per user, subscribed before triggering, so that no message is missed.
+        # Each one is drained all along, but keeps only its user's messages until its turn:
+        subs = {u.user: PubSub(self.paths, subscribe=True, keep=user_messages(u.user)) for u in auto_users}
+        try:
+            self.set_waiting_for(auto_users[0].user)
+            trigger_limit = asyncio.Semaphore(TRIGGER_CONCURRENCY)
+            triggers = [
+                asyncio.create_task(self.trigger_user(u, subs[u.user], trigger_limit))
+                for u in auto_users
+            ]
+            try:
+                for user, trigger in zip(auto_users, triggers, strict=True):
+                    self.logger.debug(f'{user.user}: waiting_for')
+                    self.set_waiting_for(user.user)
+                    if await trigger:
+                        await self.wait_user_backup(user, subs[user.user])
+            finally:
+                await gather_raise(*triggers)
+        finally:
+            for sub in subs.values():
+                sub.close()
 
-        ssh_cfg = SshConfig(user['ssh'])
-        started, ssh_error = ssh_tamborgmatic_auto(ssh_cfg)
+    async def trigger_user(self, user: UserConfig, sub: PubSub, limit: asyncio.Semaphore):
+        ssh_cfg = SshConfig(user.ssh)
+        async with limit:
+            started, ssh_error = await asyncio.to_thread(ssh_tamborgmatic_auto, ssh_cfg)
+            if not started and user.mac:
+                await asyncio.to_thread(wol, ssh_cfg, user.mac)
 
         if started:
-            self.logger.debug(f'{user['user']}: started by ssh')
-        else:
-            wol_timed_out = False
-            if user.get('mac'):
-                wol(ssh_cfg, user['mac'])
-                # Wait for on_auto_backup.sh signal:
-                started = self.pubsub.wait_for(match=f'lock_acquired {user['user']}', timeout=60)
-
-                if started:
-                    self.pubsub.wait_for(prefix=f'lock_released {user['user']} ')
-                    self.logger.debug(f'{user['user']}: WOL success')
-                else:
-                    wol_timed_out = True
-
-            if not started:
-                self.logger.warning(f"Couldn't start tamborgmatic-auto.service on {user['user']}")
-                self.logger.warning(f'- SSH: {ssh_error}')
-                if wol_timed_out:
-                    self.logger.warning('- WOL timed out')
-                return
+            self.logger.debug(f'{user.user}: started by ssh')
+            return True
 
+        wol_timed_out = False
+        if user.mac:
+            # Wait for on_auto_backup.sh signal. It's denied if it's not this user's turn yet:
+            signal = await sub.async_wait_for(
+                match=(f'lock_acquired {user.user}', f'lock_denied {user.user}'),
+                timeout=60,
+            )
+            if signal:
+                if signal.startswith('lock_acquired '):
+                    await sub.async_wait_for(prefix=f'lock_released {user.user} ')
+                self.logger.debug(f'{user.user}: WOL success')
+                return True
+            wol_timed_out = True
+
+        self.logger.warning(f"Couldn't start tamborgmatic-auto.service on {user.user}")
+        self.logger.warning(f'- SSH: {ssh_error}')
+        if wol_timed_out:
+            self.logger.warning('- WOL timed out')
+        return False
+
+    async def wait_user_backup(self, user: UserConfig, sub: PubSub):
         new_arcs_count = 0
         while new_arcs_count == 0:
             # Lock can be unacquired for long because client is running hooks.sh. Wait up to 30m:
-            acquired = self.pubsub.wait_for(match=f'lock_acquired {user['user']}', timeout=30 * 60)
+            acquired = await sub.async_wait_for(match=f'lock_acquired {user.user}', timeout=30 * 60)
             if not acquired:
-                self.logger.error(f'Timeout waiting for {user['user']} to acquire lock')
+                self.logger.error(f'Timeout waiting for {user.user} to acquire lock')
                 return
 
             # Wait infinitely for lock release. Rely on ssh timeout.
-            released = self.pubsub.wait_for(prefix=f'lock_released {user['user']} ')
+            released = await sub.async_wait_for(prefix=f'lock_released {user.user} ')
             new_arcs_count = int(released.split(' ')[2])
             # And loop until an archive is created.
             # This will be smooth on happy path. On failure, it will uselessly wait for 30m.
-        self.logger.debug(f'{user['user']}: success')
+        self.logger.debug(f'{user.user}: success')
 
-    @contextmanager
-    def data_snapshot(self, to_path: Path):
+    def update_snapshot(self, to_path: Path):
         '''
         Using a hardlinked copy is safe:
         - "[segments] are strictly append-only and modified only once."  https://borgbackup.readthedocs.io/en/stable/internals/data-structures.html#segments
         - https://github.com/borgbackup/borg/commit/4a2ab496e09b5feb5dcdb326f0c56aba1563e7ed#diff-57498cd583e81bed522aee757fb13023a9a6f99b343af93c6082f4da1bec69a0R228-R229
+
+        The snapshot is kept between runs and updated incrementally, see daily/snapshot.py.
+        It pins the segments that compact deletes until it's updated again.
         '''
-        with suppress(FileNotFoundError):
-            shutil.rmtree(to_path)
-        self.borg.with_lock.cp('-al', self.paths.repo_data, to_path)
-        try:
-            yield
-        finally:
-            shutil.rmtree(to_path)
+        stats = self.borg.with_lock(sys.executable, '-m', 'daily.snapshot', self.paths.repo_data, to_path)
+        self.logger.debug(f'Snapshot {to_path.name}: {stats.strip()}')
 
-    def rsync_current(self, *, link_dest):
+    async def rsync_current(self, *, link_dest):
         self.logger.debug('Rsyncing current to mirror...')
-        with self.mirror.mount(), self.data_snapshot(self.paths.repo_snap_current):
+        async with (
+            self.scheduler.use(self.device, self.mirror_device),
+            to_thread_cm(self.mirror.mount()),
+        ):
+            # Compacted segments stay pinned only until the next update, which in weekly runs is right after compact.
+            await asyncio.to_thread(self.update_snapshot, self.paths.repo_snap_current)
+            await asyncio.to_thread(self.transfer_current, link_dest)
+
+    def transfer_current(self, link_dest: Path):
+        '''Like `rsync -rt --link-dest`, but deciding what to link locally. See daily/mirror_manifest.py'''
+        segment_hashes = SegmentHashes(self.paths)
+        snap_files = local_files(self.paths.repo_snap_current, segment_hashes)
+        segment_hashes.save(list(snap_files))
+        to_link, to_transfer = plan(snap_files, self.mirror_manifest.get(link_dest.name))
+        to_transfer += self.mirror.bulk_link(link_dest, self.mirror.CURRENT_NEW, to_link)
+        self.logger.debug(f'Linking {len(to_link)} files in mirror, transferring {len(to_transfer)}')
+        if to_transfer:
             self.mirror.rsync(
                 '-rt',
-                f'--link-dest={link_dest}',
+                '--files-from=-',
+                '--from0',
                 f'{self.paths.repo_snap_current}/',
-                f'{self.mirror.destination}:{self.mirror.CURRENT_NEW}'
+                f'{self.mirror.destination}:{self.mirror.CURRENT_NEW}',
+                _in=join0(to_transfer),
             )
-            self.mirror.promote(self.mirror.CURRENT_NEW, self.mirror.CURRENT)
+        self.mirror.promote(self.mirror.CURRENT_NEW, self.mirror.CURRENT)
+        self.mirror_manifest.set(self.mirror.CURRENT.name, snap_files)
 
     def delete_mirror_damaged(self):
         '''
@@ -196,22 +279,20 @@ class ProcessRepo(JoinRaiseThread):
         They use hardlinks across segments to save space, but before rsyncing `checked`,
         confirm that its sources (that will be hardlinked) are intact.
         Detects if a file got corrupted, but not if it got deleted.
+        With mirror_scrub_weeks, only some files are checksummed each week, see daily/scrub.py.
+        Local hashes come from an index, so only the mirror's disk is read, see daily/segment_hashes.py.
         '''
-        self.logger.debug('Checksumming repo_snap_checked...')
-        checksum_out = self.mirror.nice_stdout_rsync(
-            '-rt',
-            '--checksum',
-            '--dry-run',
-            '--itemize-changes',
-            f'{self.paths.repo_snap_checked}/',
-            f'{self.mirror.destination}:{self.mirror.CURRENT}',
-            _iter='out',
+        scrub = MirrorScrub(self.paths, self.config.mirror_scrub_weeks)
+        segment_hashes = SegmentHashes(self.paths)
+        snap_files = local_files(self.paths.repo_snap_checked, segment_hashes)
+        segment_hashes.save(list(snap_files))
+        to_checksum = scrub.select(list(snap_files))
+        hashes = {rel_path: snap_files[rel_path][2] for rel_path in to_checksum}
+        self.logger.debug(
+            f'Checksumming {len(to_checksum)} of {len(snap_files)} files in mirror '
+            f'({segment_hashes.hashed} new to the local index)...'
         )
-        damaged_files = [
-            line.rstrip('\n').split(' ')[1]
-            for line in checksum_out
-            if line.startswith('<f') and not line.startswith('<f+++')
-        ]
+        damaged_files = self.mirror.verify_hashes(self.mirror.CURRENT, hashes)
         if damaged_files:
             self.logger.warning(f'Deleting damaged files in mirror: {damaged_files}')
             self.mirror.rsync(
@@ -223,44 +304,49 @@ class ProcessRepo(JoinRaiseThread):
                 _in=join0(damaged_files),
                 _ok_code=[0, 24],  # 24: "some files vanished" is expected when source is empty
             )
+            self.mirror_manifest.forget(self.mirror.CURRENT.name, damaged_files)
         else:
             self.logger.debug('No damaged files in mirror')
+        scrub.done(to_checksum)
         return damaged_files
 
     def prune(self):
         self.logger.debug('Pruning...')
-        prune_kwargs = get_config()['repos'][self.repo]['prune']
-        within_kwargs = {
-            **prune_kwargs,
-            'keep_within': f"{prune_kwargs['keep_daily']}d",
-        }
-        within_kwargs.pop('keep_daily', None)
-
-        for u in filter(lambda u: u['repo'] == self.repo, get_config()['users']):
-            self.borg.prune(u['user'], **within_kwargs)
-            self.borg.prune(u['user'], **prune_kwargs)
-            # Two similar prunes to handle different cases. Assume today is 2026-01-01:
-            #
-            # Pass 1 (keep_within={keep_daily}d + keep_weekly + ...):
-            #   Ensures not too much far granularity is kept. For example, a computer which backups once a month,
-            #   but that backed up every day from 2025-08-01 to 2025-08-10,
-            #   keep_daily=15 would keep the following 15 archives:
-            #   2025-12-01, 2025-11-01, 2025-10-01, 2025-09-01, 2025-08-10, 2025-08-09, ... 2025-08-01, ...
-            #   Instead, keep_within=15d and keep_weekly leave only backups for 3 and 10 of August (one per week).
-            #
-            # Pass 2 (keep_daily + keep_weekly + ...):
-            #   Prunes same-day duplicates. If a computer backed up twice on 2025-12-30 (within keep_within=15d),
-            #   only the second archive of those is kept.
-            #
-            # Swapping the order of the passes would protect more far archives.
+        # Two similar prunes per user to handle different cases. Assume today is 2026-01-01:
+        #
+        # Pass 1 (keep_within={keep_daily}d + keep_weekly + ...):
+        #   Ensures not too much far granularity is kept. For example, a computer which backups once a month,
+        #   but that backed up every day from 2025-08-01 to 2025-08-10,
+        #   keep_daily=15 would keep the following 15 archives:
+        #   2025-12-01, 2025-11-01, 2025-10-01, 2025-09-01, 2025-08-10, 2025-08-09, ... 2025-08-01, ...
+        #   Instead, keep_within=15d and keep_weekly leave only backups for 3 and 10 of August (one per week).
+        #
+        # Pass 2 (keep_daily + keep_weekly + ...):
+        #   Prunes same-day duplicates. If a computer backed up twice on 2025-12-30 (within keep_within=15d),
+        #   only the second archive of those is kept.
+        #
+        # Swapping the order of the passes would protect more far archives.
+        #
+        # Both passes are planned from a single `borg list` (see daily/prune.py),
+        # and everything is deleted by a single `borg delete`, instead of a `borg prune` per pass and user.
+        users = [u.user for u in get_config().repo_users[self.repo]]
+        passes = plan_prune(parse_archives(self.borg.list_json()), users, self.config.prune, datetime.now().astimezone())
+        for prune_pass in passes:
+            self.logger.debug(f'Prune plan for --glob-archives={prune_pass.glob} {prune_pass.options}:')
+            for line in prune_pass.report():
+                self.logger.debug(line)
+        names = to_delete(passes)
+        if names:
+            self.borg.delete_archives(names)
 
     # Note: Usually no "...completed" messages are logged,
-    # but it's made in the two methods below, because they're two threads running in parallel.
+    # but it's made in the two methods below, because they run in parallel.
 
     def compact(self):
         self.logger.debug('Compacting...')
-        compaction_threshold = get_config()['repos'][self.repo].get('compaction_threshold', 10)
-        self.borg.compact(compaction_threshold)
+        threshold = compaction_threshold(self.paths, self.config, self.logger)
+        if threshold is not None:
+            self.borg.compact(threshold)
         self.logger.debug('Compaction completed')
 
     def rsync_snap_checked(self):
@@ -277,43 +363,11 @@ class ProcessRepo(JoinRaiseThread):
 
         Performant alternative: mbuffer.
         '''
-        # Manually --link-dest from self.mirror.CURRENT to self.mirror.CHECKED_NEW:
-        snap_files = [
-            str(p.relative_to(self.paths.repo_snap_checked))
-            for p in self.paths.repo_snap_checked.rglob('*')
-            if p.is_file()
-        ]
-        ln_script = f'''
-            set -e
-            mkdir -p "{self.mirror.CHECKED_NEW}"
-            while IFS= read -r -d '' f; do
-              if [ -e "{self.mirror.CURRENT}/$f" ]; then
-                mkdir -p "{self.mirror.CHECKED_NEW}/$(dirname "$f")"
-                ln "{self.mirror.CURRENT}/$f" "{self.mirror.CHECKED_NEW}/$f"
-              fi
-            done
-        '''
-        self.mirror.ssh(
-            ln_script,
-            _in=join0(snap_files),
-            _err=sys.stderr,
-        )
-
-        # Find out which files should be transferred:
-        present_out = self.mirror.ssh(
-            # Doesn't work with BusyBox's find:   fr'find {self.mirror.CHECKED_NEW} -type f -printf "%P\0"',
-            # Alternative but that prefixes paths with `./`:
-            f'cd {self.mirror.CHECKED_NEW} && find . -type f -print0',
-            _err=sys.stderr,
-        )
-
-        def handle_prefix(path: str) -> str:
-            if not path.startswith('./'):
-                msg = f"Expected path to start with './', got: {path!r}"
-                raise ValueError(msg)
-            return path[2:]
-        present_files = set(map(handle_prefix, (p for p in present_out.split('\0') if p)))
-        to_transfer = [f for f in snap_files if f not in present_files]
+        # Manually --link-dest from self.mirror.CURRENT to self.mirror.CHECKED_NEW.
+        # What to link is decided locally, and the mirror tells in the same round trip which of those it's missing:
+        snap_files = local_files(self.paths.repo_snap_checked, SegmentHashes(self.paths))
+        to_link, to_transfer = plan(snap_files, self.mirror_manifest.get(self.mirror.CURRENT.name))
+        to_transfer += self.mirror.bulk_link(self.mirror.CURRENT, self.mirror.CHECKED_NEW, to_link)
 
         # Transfer them, with buffering: ( tar c | mbuffer | ssh 'tar x' )
         tar_out = sh.tar(
@@ -326,11 +380,10 @@ class ProcessRepo(JoinRaiseThread):
             _err=sys.stderr,
             _piped=True,
         )
-        mirror_mbuffer_size = get_config()['repos'][self.repo]['mirror_mbuffer_size']
         low_watermark_percent = 1
         mbuffer_out = sh.mbuffer(
             '-q',  # Don't print progress to stderr
-            '-m', mirror_mbuffer_size,
+            '-m', self.config.mirror_mbuffer_size,
             '-p', low_watermark_percent,
             _in=tar_out,
             _err=sys.stderr,
@@ -359,12 +412,13 @@ class ProcessRepo(JoinRaiseThread):
         # Note 2: _piped commands *do* raise ErrorReturnCode on failure, so it's even better than `set -o pipefail`.
 
         self.mirror.promote(self.mirror.CHECKED_NEW, self.mirror.CHECKED)
+        self.mirror_manifest.set(self.mirror.CHECKED.name, snap_files)
         self.logger.debug('Rsync checked to mirror completed')
 
-    def run_weekly(self):
+    async def run_weekly(self):
         self.logger.debug('run_weekly: started')
         try:
-            mkdir_lock(self.paths)
+            await asyncio.to_thread(mkdir_lock, self.paths)
             self.paths.lock_user.write_text('run_weekly')
         except FileExistsError:
             msg = f'Lock taken by {self.paths.lock_user.read_text()}'
@@ -372,54 +426,52 @@ class ProcessRepo(JoinRaiseThread):
 
         autorelease_lock = True
         try:
-            # Delete temp archives now, to skip checking them.
-            self.logger.debug('Deleting temp archives...')
-            self.borg.delete_temp_archives()
-
-            # Check repo
-            def on_check_output_line(line: str):
-                self.logger.debug(f'borg check: {line}')
-            try:
-                autorelease_lock = False
-                self.borg.check(on_check_output_line)
-                autorelease_lock = True
-            except sh.ErrorReturnCode as e:
-                self.logger.info('Append-only rollback instructions: https://borgbackup.readthedocs.io/en/stable/usage/notes.html#append-only-mode-forbid-compaction')
-                msg = f'borg check failed with rc={e.exit_code}'
-                raise RuntimeError(msg) from None
+            async with self.scheduler.use(self.device):
+                # Delete temp archives now, to skip checking them.
+                self.logger.debug('Deleting temp archives...')
+                await asyncio.to_thread(self.borg.delete_temp_archives)
+
+                # Check repo
+                try:
+                    autorelease_lock = False
+                    await asyncio.to_thread(weekly_check, self.borg, self.paths, self.config, self.logger)
+                    autorelease_lock = True
+                except (sh.ErrorReturnCode, LibBorgError) as e:
+                    self.logger.info('Append-only rollback instructions: https://borgbackup.readthedocs.io/en/stable/usage/notes.html#append-only-mode-forbid-compaction')
+                    msg = f'borg check failed with rc={e.exit_code}'
+                    raise RuntimeError(msg) from None
 
             damaged_files = []
             if self.mirror:
-                with self.mirror.mount(), self.data_snapshot(self.paths.repo_snap_checked):
-                    damaged_files = self.delete_mirror_damaged()
-                    self.prune()
+                async with (
+                    self.scheduler.use(self.device, self.mirror_device),
+                    to_thread_cm(self.mirror.mount()),
+                ):
+                    await asyncio.to_thread(self.update_snapshot, self.paths.repo_snap_checked)
+                    damaged_files = await asyncio.to_thread(self.delete_mirror_damaged)
+                    await asyncio.to_thread(self.prune)
                     # Trying to parallel other operations together with the methods above would be slower,
                     # because of HDD thrashing.
-                    outer_self = self
-
-                    class CompactThread(JoinRaiseThread):
-                        def _run(self):
-                            outer_self.compact()
+                    # But these two are a single job: see mbuffer in rsync_snap_checked.
+                    await gather_raise(
+                        asyncio.to_thread(self.compact),
+                        asyncio.to_thread(self.rsync_snap_checked),
+                    )
+                    # Unlink the segments deleted by compact, so they're freed now instead of pinned until next week
+                    await asyncio.to_thread(self.update_snapshot, self.paths.repo_snap_checked)
 
-                    compact_thread = CompactThread(self.repo, self.logger)
-                    compact_thread.start()
-                    self.rsync_snap_checked()
-
-                compact_thread.join_raise()
                 # After compact and "rsync checked" finish, the new "current" copy can be rsynced.
-                self.rsync_current(
+                await self.rsync_current(
                     link_dest=self.mirror.CHECKED  # The latest copy was to checked instead of current
                 )
             else:
-                self.prune()
-                self.compact()
+                async with self.scheduler.use(self.device):
+                    await asyncio.to_thread(self.prune)
+                    await asyncio.to_thread(self.compact)
 
         finally:
             if autorelease_lock:
                 shutil.rmtree(self.paths.lock)
-                # Note: this could release the lock while compact_thread is running. But it doesn't matter:
-                # instead of the hook reliably blocking access with "Repo is locked by user run_weekly",
-                # it will less reliably block with "Underlying repo is locked".
 
         if damaged_files:
             msg = 'run_weekly completed successfully, but mirror had damaged files'
@@ -471,6 +523,11 @@ def wol(ssh_cfg: SshConfig, mac: str):
     wakeonlan.send_magic_packet(mac, ip_address=broadcast_ip)
 
 
+def user_messages(user: str):
+    """Filter for 'lock_acquired <user>', 'lock_denied <user>' and 'lock_released <user> <count>'"""
+    return lambda message: message.split(' ')[1:2] == [user]
+
+
 def join0(lines: list[str]) -> str:
     return '\0'.join(lines) + '\0'
 
@@ -0,0 +1,70 @@
+'''
+Local record of what the mirror holds, to compute transfers without scanning the mirror's disk.
+
+For each copy in the mirror (current, checked), state/<repo>/mirror_manifest.json has the
+size, mtime and sha256 of every file, as they were in the local snapshot that was transferred.
+Hashes come from the segment hash index, so each file is read once, see daily/segment_hashes.py.
+Files that match are hardlinked from the previous copy, and only the rest are transferred.
+The mirror confirms the links (see mirror_server/bulk_link.py), and files it's missing are transferred too.
+
+A copy without a manifest (first run, or after it's lost) is linked by name, and the mirror tells what's missing.
+That's fine for segments, which are written once and whose numbers aren't reused.
+'''
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from shared.utils import read_json_state, write_json_state
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from daily.segment_hashes import SegmentHashes
+    from shared.constants import Paths
+
+type Files = dict[str, list]  # relative path: [size, mtime_ns, sha256]
+
+
+class MirrorManifest:
+    def __init__(self, paths: Paths):
+        self.path = paths.mirror_manifest
+        self.copies: dict[str, Files] = read_json_state(self.path)
+
+    def get(self, copy: str) -> Files | None:
+        return self.copies.get(copy)
+
+    def set(self, copy: str, files: Files):
+        self.copies[copy] = files
+        write_json_state(self.path, self.copies)
+
+    def forget(self, copy: str, rel_paths: list[str]):
+        files = self.copies.get(copy)
+        if files is not None:
+            for rel_path in rel_paths:
+                files.pop(rel_path, None)
+            write_json_state(self.path, self.copies)
+
+
+def local_files(snapshot: Path, segment_hashes: SegmentHashes) -> Files:
+    files = {}
+    for p in sorted(snapshot.rglob('*')):
+        if p.is_file():
+            st = p.stat()
+            files[str(p.relative_to(snapshot))] = [st.st_size, st.st_mtime_ns]
+    for rel_path, sha256 in segment_hashes.get(snapshot, list(files)).items():
+        files[rel_path].append(sha256)
+    return files
+
+
+def plan(files: Files, known: Files | None):
+    """Returns (to_link, to_transfer)"""
+    if known is None:
+        return list(files), []
+    to_link = []
+    to_transfer = []
+    for rel_path, fingerprint in files.items():
+        entry = known.get(rel_path)
+        # Entries written before hashes were recorded have only [size, mtime_ns]
+        matches = entry is not None and fingerprint[:len(entry)] == entry
+        (to_link if matches else to_transfer).append(rel_path)
+    return to_link, to_transfer
@@ -0,0 +1,189 @@
+'''
+Prune planner: decides what `borg prune` would delete, for all users of a repo,
+from a single `borg list --json`, and then deletes it all with a single `borg delete`.
+
+Reproduces borg 1.4's do_prune, prune_within, prune_split and PRUNING_PATTERNS
+(https://github.com/borgbackup/borg/blob/1.4-maint/src/borg/helpers/misc.py), including keep_13weekly and keep_3monthly.
+tests/test_prune.py compares its decisions with `borg prune --dry-run`.
+
+Dry-run report of a repo, without deleting anything:
+    python -m daily.prune <repo>
+'''
+from __future__ import annotations
+
+import json
+import math
+import re
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from fnmatch import fnmatchcase
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+CHECKPOINT_RE = re.compile(r'\.checkpoint(\.\d+)?\Z')
+
+
+@dataclass(frozen=True)
+class Archive:
+    name: str
+    id: str
+    ts: datetime  # Aware, in local time
+
+    @property
+    def is_checkpoint(self):
+        return bool(CHECKPOINT_RE.search(self.name))
+
+
+def parse_archives(list_json: str):
+    '''From `borg list --json --consider-checkpoints`, whose times are local and naive.'''
+    return [
+        Archive(a['name'], a['id'], datetime.fromisoformat(a['time']).astimezone())
+        for a in json.loads(list_json)['archives']
+    ]
+
+
+def _period_func(pattern: str) -> Callable[[Archive], object]:
+    return lambda a: a.ts.strftime(pattern)
+
+
+def _quarterly_13weekly(a: Archive):
+    year, week, _ = a.ts.isocalendar()
+    # Weeks 1-13 are quarter 1, ..., 40-52 are quarter 4, and so is week 53 in years that have it
+    return (year, math.ceil(week / 13) if week <= 52 else 4)
+
+
+def _quarterly_3monthly(a: Archive):
+    return (a.ts.year, math.ceil(a.ts.month / 3))
+
+
+# In borg's order, which matters: an archive kept by a rule doesn't count for the following ones
+PRUNING_PATTERNS: dict[str, Callable[[Archive], object]] = {
+    'secondly': _period_func('%Y-%m-%d %H:%M:%S'),
+    'minutely': _period_func('%Y-%m-%d %H:%M'),
+    'hourly': _period_func('%Y-%m-%d %H'),
+    'daily': _period_func('%Y-%m-%d'),
+    'weekly': _period_func('%G-%V'),
+    'monthly': _period_func('%Y-%m'),
+    'quarterly_13weekly': _quarterly_13weekly,
+    'quarterly_3monthly': _quarterly_3monthly,
+    'yearly': _period_func('%Y'),
+}
+# config.yml's prune keys, like borg prune's options
+KEY_BY_RULE = {
+    rule: f"keep_{rule.removeprefix('quarterly_')}"
+    for rule in PRUNING_PATTERNS
+}
+INTERVAL_SECONDS = {'H': 3600, 'd': 24 * 3600, 'w': 7 * 24 * 3600, 'm': 31 * 24 * 3600, 'y': 365 * 24 * 3600}
+
+
+def prune_within(archives: list[Archive], within: str, kept_because: dict, now: datetime):
+    target = now - timedelta(seconds=int(within[:-1]) * INTERVAL_SECONDS[within[-1]])
+    result = []
+    for a in archives:
+        if a.ts > target:
+            result.append(a)
+            kept_because[a.id] = ('within', len(result))
+    return result
+
+
+def prune_split(archives: list[Archive], rule: str, n: int, kept_because: dict):
+    last = None
+    keep = []
+    period_func = PRUNING_PATTERNS[rule]
+    if n == 0:
+        return keep
+
+    a = None
+    for a in sorted(archives, key=lambda a: a.ts, reverse=True):
+        period = period_func(a)
+        if period != last:
+            last = period
+            if a.id not in kept_because:
+                keep.append(a)
+                kept_because[a.id] = (rule, len(keep))
+                if len(keep) == n:
+                    break
+    # Keep oldest archive if we didn't reach the target retention count
+    if a is not None and len(keep) < n and a.id not in kept_because:
+        keep.append(a)
+        kept_because[a.id] = (f'{rule}[oldest]', len(keep))
+    return keep
+
+
+@dataclass
+class PrunePass:
+    '''One `borg prune --glob-archives=<glob> <keep options>`'''
+    glob: str
+    options: dict[str, int | str]
+    to_delete: list[Archive] = field(default_factory=list)
+    kept_because: dict[str, tuple[str, int]] = field(default_factory=dict)
+
+    def run(self, archives: list[Archive], now: datetime):
+        archives_checkpoints = sorted(
+            (a for a in archives if fnmatchcase(a.name, self.glob)),
+            key=lambda a: a.ts,
+            reverse=True,
+        )
+        checkpoints = [a for a in archives_checkpoints if a.is_checkpoint]
+        archives = [a for a in archives_checkpoints if not a.is_checkpoint]
+        # Keep the latest checkpoint, if there's no later archive
+        keep_checkpoints = checkpoints[:1] if checkpoints and (not archives or checkpoints[0].ts > archives[0].ts) else []
+
+        keep = []
+        if 'keep_within' in self.options:
+            keep += prune_within(archives, self.options['keep_within'], self.kept_because, now)
+        for rule, key in KEY_BY_RULE.items():
+            if key in self.options:
+                keep += prune_split(archives, rule, self.options[key], self.kept_because)
+
+        kept_ids = {a.id for a in keep + keep_checkpoints}
+        self.to_delete = [a for a in archives_checkpoints if a.id not in kept_ids]
+        return self
+
+    def report(self):
+        deleted_ids = {a.id for a in self.to_delete}
+        for a in sorted(self.to_delete, key=lambda a: a.ts, reverse=True):
+            yield f'Would prune: {a.name}'
+        for archive_id, (rule, number) in self.kept_because.items():
+            if archive_id not in deleted_ids:
+                yield f'Keeping archive (rule: {rule} #{number}): {archive_id}'
+
+
+def plan_prune(archives: list[Archive], users: list[str], prune: dict[str, int], now: datetime):
+    '''
+    Both passes of ProcessRepo.prune for each user, the second one on what's left after the first one.
+    Returns the passes, with what each one deletes.
+    '''
+    within_options = {**prune, 'keep_within': f"{prune['keep_daily']}d"}
+    within_options.pop('keep_daily')
+
+    passes = []
+    for user in users:
+        remaining = archives
+        for options in (within_options, prune):
+            prune_pass = PrunePass(f'{user}-*', options).run(remaining, now)
+            passes.append(prune_pass)
+            deleted_ids = {a.id for a in prune_pass.to_delete}
+            remaining = [a for a in remaining if a.id not in deleted_ids]
+    return passes
+
+
+def to_delete(passes: list[PrunePass]):
+    return [a.name for p in passes for a in p.to_delete]
+
+
+if __name__ == '__main__':
+    from shared.config import get_config
+    from shared.constants import Paths
+    from shared.shell import Borg
+
+    repo = sys.argv[1]
+    _archives = parse_archives(Borg(Paths(repo)).list_json())
+    _users = [u.user for u in get_config().repo_users[repo]]
+    for _pass in plan_prune(_archives, _users, get_config().repos[repo].prune, datetime.now().astimezone()):
+        sys.stdout.write(f'--glob-archives={_pass.glob} {_pass.options}\n')
+        for line in _pass.report():
+            sys.stdout.write(f'{line}\n')
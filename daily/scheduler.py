@@ -0,0 +1,38 @@
+"""
+Per-device scheduling of borg-daily's seek-heavy jobs.
+
+Devices are names declared in config.yml (see RepoConfig.device). Jobs on the same device run one at a time,
+because HDD thrashing makes two concurrent jobs slower than running them in sequence.
+Jobs on different devices run concurrently.
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import defaultdict
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+
+class DeviceScheduler:
+    def __init__(self):
+        self.locks = defaultdict[str, asyncio.Lock](asyncio.Lock)
+
+    @asynccontextmanager
+    async def use(self, *devices: str):
+        """
+        Holds all the devices of a job, like a repo and its mirror for an rsync.
+        They're acquired in sorted order, so that two jobs can't deadlock each other.
+        Not reentrant: a job must not use() again inside.
+        """
+        async with AsyncExitStack() as stack:
+            for device in sorted(set(devices)):
+                await stack.enter_async_context(self.locks[device])
+            yield
+
+    async def run[T](self, devices: list[str], func: Callable[..., T], *args, **kwargs) -> T:
+        """Runs a blocking job in a thread, holding its devices."""
+        async with self.use(*devices):
+            return await asyncio.to_thread(func, *args, **kwargs)
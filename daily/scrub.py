@@ -0,0 +1,48 @@
+'''
+Which files of the mirror to verify each week, with mirror_scrub_weeks: N.
+
+Segments are verified in N slots, one per week: slot k is the segments with number % N == k.
+So every segment is verified at least once every N weeks.
+Segments written since the previous scrub (numbers are increasing) are always verified,
+as well as any file that isn't a segment.
+Everything is verified on the first run, and every week with N = 1.
+
+The state is saved in state/<repo>/mirror_scrub.json when a scrub completes.
+'''
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from shared.utils import read_json_state, write_json_state
+
+if TYPE_CHECKING:
+    from shared.constants import Paths
+
+
+class MirrorScrub:
+    def __init__(self, paths: Paths, weeks: int):
+        self.path = paths.mirror_scrub
+        self.weeks = weeks
+        self.state = read_json_state(self.path)
+        self.slot = self.state.get('next_slot', 0) % weeks
+        self.last_max_segment = self.state.get('max_segment', -1)
+
+    def select(self, rel_paths: list[str]):
+        selected = []
+        for rel_path in rel_paths:
+            segment = segment_number(rel_path)
+            if segment is None or segment % self.weeks == self.slot or segment > self.last_max_segment:
+                selected.append(rel_path)
+        return selected
+
+    def done(self, rel_paths: list[str]):
+        segments = [s for s in map(segment_number, rel_paths) if s is not None]
+        self.state['next_slot'] = (self.slot + 1) % self.weeks
+        self.state['max_segment'] = max([self.last_max_segment, *segments])
+        write_json_state(self.path, self.state)
+
+
+def segment_number(rel_path: str):
+    """data/<dir>/<segment> -> segment, or None if it's not a segment"""
+    name = rel_path.rpartition('/')[2]
+    return int(name) if name.isdigit() else None
@@ -0,0 +1,45 @@
+'''
+Persistent sha256 index of the repo's segment files, to verify the mirror without reading the local disk.
+
+Segments are written once, so a segment is hashed when it first shows up in a snapshot, and never again.
+Entries are keyed by (ino, size, mtime_ns): if a file doesn't match its entry anymore, it's hashed again.
+The index is saved in state/<repo>/segment_hashes.json.
+'''
+from __future__ import annotations
+
+import hashlib
+from typing import TYPE_CHECKING
+
+from shared.utils import read_json_state, write_json_state
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from shared.constants import Paths
+
+
+class SegmentHashes:
+    def __init__(self, paths: Paths):
+        self.path = paths.segment_hashes
+        self.index: dict[str, list] = read_json_state(self.path)  # relative path: [ino, size, mtime_ns, sha256]
+        self.hashed = 0
+
+    def get(self, snapshot: Path, rel_paths: list[str]):
+        hashes = {}
+        for rel_path in rel_paths:
+            file = snapshot / rel_path
+            st = file.stat()
+            key = [st.st_ino, st.st_size, st.st_mtime_ns]
+            entry = self.index.get(rel_path)
+            if not entry or entry[:3] != key:
+                with file.open('rb') as f:
+                    entry = [*key, hashlib.file_digest(f, 'sha256').hexdigest()]
+                self.index[rel_path] = entry
+                self.hashed += 1
+            hashes[rel_path] = entry[3]
+        return hashes
+
+    def save(self, rel_paths: list[str]):
+        """Keeps only the entries of rel_paths, those in the current snapshot."""
+        self.index = {p: self.index[p] for p in rel_paths if p in self.index}
+        write_json_state(self.path, self.index)
@@ -1,36 +1,80 @@
+import asyncio
 import json
+import time
 from pathlib import Path
 
 import sh
 
-from daily.utils import hc_ping, logger
+from daily.healthcheck import healthchecks
+from daily.utils import gather_raise, logger
 from shared.config import get_config
+from shared.constants import Paths
+from shared.utils import read_json_state, write_json_state
 
 
-def smarthealthc():
-    """Like https://github.com/zzdroide/borgmatic/blob/master/hooks.d/helpers/smart_check_disk.sh"""
+async def smarthealthc():
+    """
+    Like https://github.com/zzdroide/borgmatic/blob/master/hooks.d/helpers/smart_check_disk.sh
 
-    for hc_url, disk in get_config()['smarthealthc']:
-        action, msg = process_disk(disk)
+    Disks are checked concurrently, and not woken up from standby for it:
+    the last result read while the disk was awake is reused, up to smart_max_age_days.
+    Disks that were busy with backups since are awake anyway, so they get a fresh result.
+    """
+    cache = read_json_state(Paths.smart_cache)
+    await gather_raise(*(
+        asyncio.to_thread(check_disk, hc_url, disk, cache)
+        for hc_url, disk in get_config().smarthealthc
+    ))
+    write_json_state(Paths.smart_cache, cache)
 
-        if action == 'log':
-            logger.warning(msg)
-        elif action == 'fail':
-            logger.error(msg)
 
-        hc_ping(f'{hc_url}/{action}', msg)
+def check_disk(hc_url: str, disk: str, cache: dict):
+    action, msg = process_disk(disk, cache)
 
+    if action == 'log':
+        logger.warning(msg)
+    elif action == 'fail':
+        logger.error(msg)
 
-def process_disk(disk: str):
+    healthchecks.ping(f'{hc_url}/{action}', msg)
+
+
+def process_disk(disk: str, cache: dict):
     if not Path(disk).is_block_device():
         return 'log', f'Disk {disk} is not present'
 
+    cached = cache.get(disk)
+    max_age = get_config().smart_max_age_days * 24 * 3600
+    fresh_enough = cached is not None and time.time() - cached['time'] < max_age
+
+    # Wakes up the disk only if the cached result is too old
     try:
-        info = sh.sudo('/usr/sbin/smartctl', '-HA', '--json=c', disk, _ok_code=range(256))
-        data = json.loads(info)
+        data = smartctl(disk, standby=fresh_enough)
     except Exception as e:
         return 'log', f'Failed to get smart info for {disk}: {e}'
+    if fresh_enough and is_standby(data):
+        return cached['action'], cached['msg']
+
+    action, msg = evaluate(disk, data)
+    if action != 'log':
+        cache[disk] = {'time': time.time(), 'action': action, 'msg': msg}
+    return action, msg
+
+
+def smartctl(disk: str, *, standby: bool):
+    """With standby, doesn't wake up the disk, and the output says so if it's in standby (see is_standby)."""
+    standby_args = ['-n', 'standby'] if standby else []
+    info = sh.sudo('/usr/sbin/smartctl', *standby_args, '-HA', '--json=c', disk, _ok_code=range(256))
+    return json.loads(info)
+
+
+def is_standby(data: dict):
+    """`-n standby` skipped the disk: "Device is in STANDBY mode, exit(2)", or SLEEP, or IDLE..."""
+    messages = data.get('smartctl', {}).get('messages', [])
+    return 'smart_status' not in data and any(' mode, exit(' in m.get('string', '') for m in messages)
+
 
+def evaluate(disk: str, data: dict):
     if data.get('json_format_version') != [1, 0]:
         return 'log', "json_format_version doesn't match"
 
@@ -0,0 +1,79 @@
+'''
+Incremental hardlinked snapshot of a repo's data dir, to be run under the repo lock:
+
+    borg with-lock :: python -m daily.snapshot <repo data> <snapshot>
+
+Instead of `rm -rf snapshot && cp -al data snapshot`, an existing snapshot is updated:
+files already linked to the same inode are kept, new ones are linked, and vanished or replaced ones are removed.
+Directories are listed with scandir, whose inode numbers come from readdir, so kept files aren't even stat'ed.
+'''
+from __future__ import annotations
+
+import os
+import shutil
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass
+class SnapshotStats:
+    linked: int = 0
+    kept: int = 0
+    removed: int = 0
+    seconds: float = 0
+
+    def __str__(self):
+        return f'linked {self.linked}, kept {self.kept}, removed {self.removed} in {self.seconds:.2f}s'
+
+
+def update_snapshot(src: Path, dst: Path):
+    stats = SnapshotStats()
+    start = time.perf_counter()
+    _update_dir(str(src), str(dst), stats)
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def _update_dir(src: str, dst: str, stats: SnapshotStats):
+    try:
+        with os.scandir(dst) as entries:
+            existing = {e.name: e for e in entries}
+    except FileNotFoundError:
+        os.mkdir(dst)  # noqa: PTH102
+        existing = {}
+
+    with os.scandir(src) as entries:
+        for entry in entries:
+            dst_entry = existing.pop(entry.name, None)
+            dst_path = os.path.join(dst, entry.name)  # noqa: PTH118  # No Path objects per file, there are tens of thousands
+            if entry.is_dir(follow_symlinks=False):
+                if dst_entry and not dst_entry.is_dir(follow_symlinks=False):
+                    _remove(dst_entry, stats)
+                _update_dir(entry.path, dst_path, stats)
+                continue
+
+            if dst_entry:
+                if not dst_entry.is_dir(follow_symlinks=False) and dst_entry.inode() == entry.inode():
+                    stats.kept += 1
+                    continue
+                _remove(dst_entry, stats)
+            os.link(entry.path, dst_path, follow_symlinks=False)
+            stats.linked += 1
+
+    for dst_entry in existing.values():
+        _remove(dst_entry, stats)
+
+
+def _remove(entry: os.DirEntry, stats: SnapshotStats):
+    if entry.is_dir(follow_symlinks=False):
+        shutil.rmtree(entry.path)
+    else:
+        os.unlink(entry.path)  # noqa: PTH108
+    stats.removed += 1
+
+
+if __name__ == '__main__':
+    _src, _dst = sys.argv[1:]
+    sys.stdout.write(f'{update_snapshot(Path(_src), Path(_dst))}\n')
@@ -1,41 +1,37 @@
 from __future__ import annotations
 
-from abc import ABC, abstractmethod
-from threading import Thread
-
-import requests
+import asyncio
+from contextlib import AbstractContextManager, asynccontextmanager
+from typing import TYPE_CHECKING
 
 from shared.utils import LoggerPurpose, get_logger
 
+if TYPE_CHECKING:
+    from collections.abc import Awaitable
+
 logger = get_logger('borg_daily', LoggerPurpose.DAILY)
 
 
-def hc_ping(url: str, data: str | None = None):
+async def gather_raise(*aws: Awaitable):
+    """
+    Like asyncio.gather, but the first error is raised only after all awaitables finish,
+    so that a failure in one repo doesn't cancel the others.
+    """
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+@asynccontextmanager
+async def to_thread_cm[T](cm: AbstractContextManager[T]):
+    """Enters and exits a blocking context manager (like Mirror.mount) in a thread."""
+    value = await asyncio.to_thread(cm.__enter__)
     try:
-        r = requests.post(url, data=data, timeout=10)
-        r.raise_for_status()
-    except requests.RequestException as e:
-        logger.error(f'Healthcheck failed: {e}')
-
-
-class JoinRaiseThread(Thread, ABC):
-    def __init__(self, name, logger):
-        super().__init__(name=name)
-        self.logger = logger
-        self.exception: Exception | None = None
-
-    def run(self):
-        try:
-            self._run()
-        except Exception as e:
-            self.logger.exception('')
-            self.exception = e
-
-    @abstractmethod
-    def _run(self):
-        pass
-
-    def join_raise(self, timeout=None):
-        self.join(timeout)
-        if self.exception:
-            raise self.exception
+        yield value
+    except BaseException as e:
+        if not await asyncio.to_thread(cm.__exit__, type(e), e, e.__traceback__):
+            raise
+    else:
+        await asyncio.to_thread(cm.__exit__, None, None, None)
@@ -0,0 +1,44 @@
+"""
+Tiny PAM client for hook/server.py. Run with the system python, so only the standard library is imported.
+
+If the hook service is not running, falls back to running the hook in this session.
+If it's running but doesn't answer in time, access is denied, like when the hook fails.
+"""
+import os
+import socket
+import sys
+from pathlib import Path
+
+from shared.constants import RC, Paths
+
+# Longer than the hook takes, even with borg waiting for the repo lock (its default --lock-wait is 1s)
+# and for disks to spin up. So that a stuck service doesn't hang the session.
+TIMEOUT = 60
+
+
+def main():
+    request = '\x00'.join((os.environ.get('PAM_TYPE', ''), os.environ.get('SSH_AUTH_INFO_0', '')))
+
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(TIMEOUT)
+        sock.connect(str(Paths.hook_socket))
+    except OSError:
+        # Service is not running. Take the slow path, which needs a login shell for poetry.
+        hook_sh = Path(__file__).resolve().parent.parent / 'hook.sh'
+        os.execv('/bin/zsh', ['zsh', '-lc', f'exec {hook_sh} pam'])  # noqa: S606
+
+    with sock:
+        try:
+            sock.sendall(request.encode('utf-8'))
+            sock.shutdown(socket.SHUT_WR)
+            response = sock.recv(1)
+        except TimeoutError:
+            # The service releases the lock if it acquires it afterwards, see hook/server.py
+            sys.exit(RC.access_denied)
+
+    sys.exit(response[0] if response else RC.generic_error)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,14 +4,23 @@ import os
 import re
 import shutil
 import sys
+from typing import TYPE_CHECKING
 
 from shared.config import get_config_from_pk, get_config_repos
 from shared.constants import RC, Paths
 from shared.pubsub import PubSub
-from shared.shell import Borg
 from shared.utils import LoggerPurpose, get_logger, mkdir_lock
 
-from .utils import BadRepoError, get_waiting_for, without_user_temp
+from .utils import (
+    BadRepoError,
+    arcs_digest,
+    digest_count,
+    get_waiting_for,
+    without_user_temp,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
 
 # stdout/stderr from this script breaks borg with: Got unexpected RPC data format from server: <message>
 logger = get_logger('borg_ssh_hook', LoggerPurpose.HOOK)  # Logs from logging.WARNING level.
@@ -20,12 +29,15 @@ logger = get_logger('borg_ssh_hook', LoggerPurpose.HOOK)  # Logs from logging.WA
 
 
 class Hook:
-    def __init__(self, repo: str):
+    def __init__(self, repo: str, passphrase_ttl: float | None = None):
         self.repo = repo
         self.paths = Paths(repo)
         self.paths.repo_state.mkdir(parents=True, exist_ok=True)
-        self.borg = Borg(self.paths)
-        self.pubsub = PubSub(self.paths, start=False)
+
+        # Imported here because sh is slow to import, and invalid usage doesn't need it.
+        from shared.shell import Borg
+        self.borg = Borg(self.paths, passphrase_ttl)
+        self.pubsub = PubSub(self.paths, subscribe=False)
 
     def check_repo(self, user: str | None, *, release_on_restart=False) -> int:
         if not release_on_restart:
@@ -36,14 +48,14 @@ class Hook:
                 msg = f'User from pk is {user} but lock was taken by {lock_user}'
                 raise AssertionError(msg)
 
-            prev_arcs = without_user_temp(self.paths.lock_prev_arcs.read_text(), user)
+            prev_digest = self.paths.lock_prev_digest.read_text()
 
         else:
             logger.info(f'Checking repo {self.repo} for release_on_restart...')
 
             try:
                 user = self.paths.lock_user.read_text()
-                prev_arcs = without_user_temp(self.paths.lock_prev_arcs.read_text(), user)
+                prev_digest = self.paths.lock_prev_digest.read_text()
             except FileNotFoundError as e:
                 # Lock was incompletely written, so no "borg serve" should have taken place.
                 # Anyway, can't check without any of those files.
@@ -55,57 +67,71 @@ class Hook:
         cur_arcs = without_user_temp(self.borg.dump_arcs(), user)
 
         # Check that previous archives are intact, except for f'{user}(temp)-*'
-        if not cur_arcs.startswith(prev_arcs):
+        prev_count = digest_count(prev_digest)
+        if arcs_digest(cur_arcs[:prev_count]) != prev_digest:
             msg = 'Previous archives were modified!'
             raise BadRepoError(msg)
 
         # Check that new archives begin with user prefix (excluding f'{user}(temp)-*')
-        new_arcs = cur_arcs.replace(prev_arcs, '', 1)
-        new_count = 0
-        while new_arcs:
-            _arc_id, _sep, new_arcs = new_arcs.partition('\x00')
-            arc_name, _sep, new_arcs = new_arcs.partition('\x00')
+        new_arcs = cur_arcs[prev_count:]
+        for _arc_id, arc_name in new_arcs:
             if not arc_name.startswith(user + '-'):
                 msg = f"Created [{arc_name}] that doesn't start with [{user}-]!"
                 raise BadRepoError(msg)
-            new_count += 1
 
         logger.info('...OK')
-        return new_count
+        return len(new_arcs)
 
     def acquire_lock(self, user: str):
         logger.info(f'{user} is acquiring lock for {self.repo}...')
 
         if not self.paths.repo_enabled.exists():
-            logger.warning('Repo access is disabled')
-            sys.exit(RC.access_denied)
+            self.deny(user, 'Repo access is disabled')
 
         waiting_for = get_waiting_for(self.repo)
         if waiting_for and waiting_for != user:
-            logger.warning(f'Repo is waiting_for {waiting_for} instead')
-            sys.exit(RC.access_denied)
-
-        if not self.borg.is_repo_unlocked():
-            logger.warning('Underlying repo is locked')
-            sys.exit(RC.access_denied)
+            self.deny(user, f'Repo is waiting_for {waiting_for} instead')
 
         try:
             mkdir_lock(self.paths)
         except FileExistsError:
-            logger.warning(f'Repo is locked by user {self.paths.lock_user.read_text()}')
+            self.deny(user, f'Repo is locked by user {self.paths.lock_user.read_text()}')
             # Note: there's a small window for lock_user read to fail. Ignore.
-            sys.exit(RC.access_denied)
 
         self.paths.lock_user.write_text(user)
-        self.paths.lock_prev_arcs.write_text(self.borg.dump_arcs())
-        self.pubsub.publish(f'lock_acquired {user}')
+
+        # Single borg process for both the underlying lock check and the archives list.
+        # Listed after mkdir_lock, so that no other session can add archives in between.
+        from shared.shell import RepoLockedError
+        try:
+            dump = self.borg.dump_arcs()
+        except BaseException as e:
+            # Whatever failed, don't leave the repo locked without a digest
+            shutil.rmtree(self.paths.lock)
+            if isinstance(e, RepoLockedError):
+                self.deny(user, 'Underlying repo is locked')
+            raise
+
+        self.paths.lock_prev_digest.write_text(arcs_digest(without_user_temp(dump, user)))
+        self.publish(f'lock_acquired {user}')
         logger.info('...OK')
 
+    def publish(self, message: str):
+        missed = self.pubsub.publish(message)
+        if missed:
+            logger.info(f'Subscribers {missed} missed {message!r}, their queue is full')
+
+    def deny(self, user: str, reason: str):
+        logger.warning(reason)
+        # Tells borg-daily that a woken up client is trying to connect, before it's its turn:
+        self.publish(f'lock_denied {user}')
+        sys.exit(RC.access_denied)
+
     def release_lock(self, user: str):
         try:
             new_arcs_count = self.check_repo(user)
             shutil.rmtree(self.paths.lock)
-            self.pubsub.publish(f'lock_released {user} {new_arcs_count}')
+            self.publish(f'lock_released {user} {new_arcs_count}')
         except Exception:
             logger.exception('Error releasing lock')
             sys.exit(RC.generic_error)
@@ -154,11 +180,22 @@ def main(argv):
     if hook_src == 'tamborg-release-lock':
         Hook.release_locks_on_restart()
         return
+    if hook_src == 'serve':
+        from .server import serve
+        serve()
+        return
     if hook_src != 'pam':
         logger.error(f'Invalid hook_src: {hook_src}')
         sys.exit(RC.invalid_usage)
 
-    ssh_auth_info = os.environ.get('SSH_AUTH_INFO_0')
+    pam(os.environ.get('PAM_TYPE'), os.environ.get('SSH_AUTH_INFO_0'))
+
+
+def pam(pam_type: str | None, ssh_auth_info: str | None, get_hook: Callable[[str], Hook] = Hook):
+    """
+    Handles a PAM call, either from this process (`hook.sh pam`) or from the hook service.
+    Like the rest of the hook, it exits with a RC on failure.
+    """
     try:
         pk = re.fullmatch(r'publickey ([a-z0-9-]+ [a-zA-Z0-9+/=]+)\n?', ssh_auth_info)[1]
         repo, user = get_config_from_pk(pk)
@@ -166,9 +203,8 @@ def main(argv):
         logger.exception(f'Failed to get user from pubkey. $SSH_AUTH_INFO_0: {ssh_auth_info!r}')
         sys.exit(RC.invalid_usage)
 
-    hook = Hook(repo)
+    hook = get_hook(repo)
 
-    pam_type = os.environ.get('PAM_TYPE')
     match pam_type:
         case 'open_session':
             hook.acquire_lock(user)
@@ -0,0 +1,69 @@
+"""
+Long-lived hook service, so that PAM sessions don't pay for poetry, interpreter startup and imports.
+
+hook/client.py forwards $PAM_TYPE and $SSH_AUTH_INFO_0 through a Unix socket,
+and exits with the RC returned here.
+"""
+from __future__ import annotations
+
+import contextlib
+import socketserver
+from threading import Lock
+
+from systemd import daemon
+
+from shared.constants import RC, Paths
+
+from .main import Hook, logger, pam
+
+# Short-lived, so that the passphrase isn't kept in memory between backup sessions
+PASSPHRASE_TTL = 15 * 60
+
+
+class HookHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = self.rfile.read().decode('utf-8')
+        pam_type, _sep, ssh_auth_info = request.partition('\x00')
+        rc = self.run_pam(pam_type, ssh_auth_info)
+        try:
+            self.wfile.write(bytes([rc]))
+        except OSError:
+            logger.warning(f'Hook client timed out before {pam_type} finished')
+            if pam_type == 'open_session' and rc == 0:
+                # The session was denied, so there won't be a close_session to release the lock
+                self.run_pam('close_session', ssh_auth_info)
+
+    def run_pam(self, pam_type: str, ssh_auth_info: str):
+        try:
+            pam(pam_type, ssh_auth_info, self.server.get_hook)
+            return 0
+        except SystemExit as e:
+            return e.code or 0
+        except Exception:
+            logger.exception('Unhandled error in hook service')
+            return RC.generic_error
+
+
+class HookServer(socketserver.ThreadingUnixStreamServer):
+    # Threaded, because open_session retries mkdir_lock while the previous close_session is releasing.
+    daemon_threads = True
+
+    def __init__(self):
+        with contextlib.suppress(FileNotFoundError):
+            Paths.hook_socket.unlink()
+        super().__init__(str(Paths.hook_socket), HookHandler)
+        self.hooks: dict[str, Hook] = {}
+        self.hooks_lock = Lock()
+
+    def get_hook(self, repo: str):
+        with self.hooks_lock:
+            if repo not in self.hooks:
+                self.hooks[repo] = Hook(repo, PASSPHRASE_TTL)
+            return self.hooks[repo]
+
+
+def serve():
+    with HookServer() as server:
+        daemon.notify('READY=1')
+        logger.info(f'Hook service listening on {Paths.hook_socket}')
+        server.serve_forever()
@@ -1,47 +1,57 @@
 from __future__ import annotations
 
-import requests
-from requests.adapters import HTTPAdapter
-from requests.exceptions import RequestException
+import hashlib
+from typing import TYPE_CHECKING
 
+from shared.constants import Paths
+from shared.waiting_for import read_waiting_for
 
-def arcs2str(arcs: list):
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+
+def arcs2str(arcs: Iterable[tuple[str, str]]):
     lines = (f'{arc[0]}\x00{arc[1]}\x00' for arc in arcs)
     return ''.join(lines)
 
 
+def iter_arcs(dump: str) -> Iterator[tuple[str, str]]:
+    """
+    Yields (id, name) from a `{id}{NUL}{barchive}{NUL}` dump.
+    Splits once, instead of partitioning (and copying) the remaining dump for each archive.
+    """
+    fields = iter(dump.split('\x00'))
+    return zip(fields, fields, strict=False)  # Drops the empty field after the last NUL
+
+
 def arcs2list(dump: str):
-    arcs = []
-    while dump:
-        arc_id, _sep, dump = dump.partition('\x00')
-        arc_name, _sep, dump = dump.partition('\x00')
-        arcs.append((arc_id, arc_name))
-    return arcs
+    return list(iter_arcs(dump))
 
 
-def without_user_temp(arcs: list | str, user: str):
+def without_user_temp(arcs: Iterable[tuple[str, str]] | str, user: str):
     if isinstance(arcs, str):
-        arcs = arcs2list(arcs)
-    return arcs2str(
-        [arc for arc in arcs if not arc[1].startswith(f'{user}(temp)-')]
-    )
+        arcs = iter_arcs(arcs)
+    temp_prefix = f'{user}(temp)-'
+    return [arc for arc in arcs if not arc[1].startswith(temp_prefix)]
 
 
-class BadRepoError(Exception):
-    pass
+def arcs_digest(arcs: list):
+    """
+    Count and hash of the ordered archives.
+    Stored at acquire_lock instead of the whole list, and compared at release against the same number of archives.
+    """
+    h = hashlib.sha256(arcs2str(arcs).encode('utf-8', 'surrogateescape'))
+    return f'{len(arcs)} {h.hexdigest()}'
+
+
+def digest_count(digest: str):
+    return int(digest.partition(' ')[0])
 
 
-session = requests.Session()
-adapter = HTTPAdapter(max_retries=0)
-session.mount('http://', adapter)
+class BadRepoError(Exception):
+    pass
 
 
 def get_waiting_for(repo: str):
-    """Just a convenience. Not for security because http server can be trivially DoSed."""
-    try:
-        r = session.get(f'http://127.0.0.1:8087/{repo}', timeout=1)
-        r.raise_for_status()
-        r.encoding = 'utf-8'
-        return r.text.strip()
-    except RequestException:
-        return None
+    """Just a convenience. Not for security, borg-daily could be stopped any time."""
+    return read_waiting_for(Paths(repo))
@@ -0,0 +1,3 @@
+#!/bin/sh
+cd "$(dirname "$0")" || exit 1
+exec python3 -m hook.client "$@"
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Hardlinks files from one copy of the repo data to another, in a single invocation.
+
+Usage: bulk_link.py <source dir> <dest dir>
+stdin: NUL-separated relative paths to link from source to dest.
+stdout: NUL-separated relative paths that weren't in source, so they have to be transferred.
+
+Replaces a remote shell loop that forked mkdir and ln per file.
+Runs in the mirror container with the system python3, so stdlib only.
+"""
+import os
+import sys
+from pathlib import Path
+
+
+def bulk_link(src: Path, dst: Path, rel_paths: list[str]):
+    missing = []
+    created_dirs = set()
+    for rel_path in rel_paths:
+        if rel_path.startswith('/') or '..' in rel_path.split('/'):
+            msg = f'Invalid path: {rel_path!r}'
+            raise ValueError(msg)
+        dst_path = dst / rel_path
+        try:
+            if dst_path.parent not in created_dirs:
+                dst_path.parent.mkdir(parents=True, exist_ok=True)
+                created_dirs.add(dst_path.parent)
+            try:
+                os.link(src / rel_path, dst_path)
+            except FileExistsError:
+                # Left by an interrupted transfer
+                dst_path.unlink()
+                os.link(src / rel_path, dst_path)
+        except FileNotFoundError:
+            missing.append(rel_path)
+    return missing
+
+
+def main():
+    src, dst = map(Path, sys.argv[1:])
+    dst.mkdir(parents=True, exist_ok=True)
+    rel_paths = [p for p in sys.stdin.buffer.read().decode('utf-8').split('\0') if p]
+    missing = bulk_link(src, dst, rel_paths)
+    sys.stdout.buffer.write(''.join(p + '\0' for p in missing).encode('utf-8'))
+
+
+if __name__ == '__main__':
+    main()
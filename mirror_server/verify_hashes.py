@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Hashes files of a copy of the repo data, and compares them with the hashes computed on the tamborg server.
+
+Usage: verify_hashes.py <dir>
+stdin: NUL-separated pairs of relative path and sha256 hex digest.
+stdout: NUL-separated relative paths whose hash doesn't match. Missing files are not reported.
+
+So that verifying the mirror reads only the mirror's disk.
+Runs in the mirror container with the system python3, so stdlib only.
+"""
+import hashlib
+import sys
+from pathlib import Path
+
+
+def verify_hashes(base: Path, hashes: dict[str, str]):
+    damaged = []
+    for rel_path, expected in hashes.items():
+        try:
+            with (base / rel_path).open('rb') as f:
+                digest = hashlib.file_digest(f, 'sha256').hexdigest()
+        except FileNotFoundError:
+            continue
+        if digest != expected:
+            damaged.append(rel_path)
+    return damaged
+
+
+def main():
+    base = Path(sys.argv[1])
+    fields = sys.stdin.buffer.read().decode('utf-8').split('\0')[:-1]
+    hashes = dict(zip(fields[::2], fields[1::2], strict=True))
+    damaged = verify_hashes(base, hashes)
+    sys.stdout.buffer.write(''.join(p + '\0' for p in damaged).encode('utf-8'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Alternative to the `sh` backend of Borg, that runs borg commands in-process.
+
+Each LibBorg keeps long-lived worker processes with borg already imported, so a command doesn't pay
+for interpreter startup and imports. Workers are separate processes because borg keeps global state
+(logging, exit code, umask) and writes to stdout, which can't be shared with other threads.
+
+That's the only gain: each command still opens the repo and loads the key and the manifest, like the borg command.
+Keeping them open would hold the repo lock for the whole ProcessRepo, while users back up.
+It's about half of a `borg list`, see tests/test_benchmarks.py.
+
+Requires borgbackup to be importable from this environment, from the optional poetry group `borg`
+(`poetry sync --with=borg`, which deploy does. The borg command itself is still installed with pipx).
+Select it per repo with `borg_backend: library` in config.yml.
+"""
+from __future__ import annotations
+
+import io
+import multiprocessing
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
+from threading import Lock
+from typing import TYPE_CHECKING
+
+from shared.shell import Borg, RepoLockedError
+from shared.verify_segments import verify_segments
+
+if TYPE_CHECKING:
+    from shared.constants import Paths
+
+EXIT_ERROR = 2
+EXIT_LOCK_TIMEOUT = 73  # With BORG_EXIT_CODES=modern
+
+
+class LibBorgError(Exception):
+    def __init__(self, argv: list[str], exit_code: int, output: str):
+        super().__init__(f'borg {" ".join(argv)} failed with rc={exit_code}:\n{output}')
+        self.exit_code = exit_code
+        self.output = output
+
+
+def _init_worker(env: dict[str, str], nice: bool):  # noqa: FBT001
+    os.environ.clear()
+    os.environ.update(env)
+    if nice:
+        # Like `nice -n19 ionice -c3`
+        os.nice(19)
+        import sh
+        sh.ionice('-c3', '-p', os.getpid())
+
+    try:
+        import borg.archiver  # noqa: F401  # Import once, that's the point of the worker
+    except ImportError as e:
+        msg = 'borg_backend: library requires borgbackup to be importable. See shared/borg_lib.py'
+        raise RuntimeError(msg) from e
+
+
+def _run_borg(argv: list[str]) -> tuple[int, str, str]:
+    """Mirrors borg.archiver.main(), minus signal handling and sys.exit(). Returns (exit code, stdout, stderr)."""
+    from borg import helpers
+    from borg.archiver import Archiver
+
+    # Reset the exit code and warnings accumulated by previous commands in this worker
+    init_ec_warnings = getattr(helpers, 'init_ec_warnings', None)
+    if init_ec_warnings:
+        init_ec_warnings()
+
+    # Separate, like the sh backend: only stdout is parsed, and stderr has warnings and logs
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    with redirect_stdout(stdout), redirect_stderr(stderr):
+        archiver = Archiver()
+        try:
+            args = archiver.get_args(['borg', *argv], None)
+            exit_code = archiver.run(args)
+        except helpers.Error as e:
+            sys.stderr.write(e.get_message() + '\n')
+            exit_code = e.exit_code
+        except SystemExit as e:  # From argparse
+            exit_code = e.code
+        except Exception:
+            traceback.print_exc()
+            exit_code = EXIT_ERROR
+    return exit_code, stdout.getvalue(), stderr.getvalue()
+
+
+def _verify_segments(segments: set[int]):
+    return verify_segments(os.environ['BORG_REPO'], segments, lock=True)
+
+
+class LibBorg(Borg):
+    def __init__(self, paths: Paths, passphrase_ttl: float | None = None):
+        super().__init__(paths, passphrase_ttl)
+        self._workers: dict[bool, ProcessPoolExecutor] = {}
+        self._workers_lock = Lock()
+
+    def _worker(self, *, nice: bool):
+        with self._workers_lock:
+            if nice not in self._workers:
+                self._workers[nice] = ProcessPoolExecutor(
+                    max_workers=1,
+                    # Not fork, because borg-daily is multi-threaded
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    # In-process, so the passphrase goes in the worker's environment
+                    initargs=({**self.env, 'BORG_PASSPHRASE': self.passphrase()}, nice),
+                )
+            return self._workers[nice]
+
+    def _submit(self, argv: list[str], *, nice: bool):
+        return self._worker(nice=nice).submit(_run_borg, argv).result()
+
+    def _run(self, *argv: str, nice=False):
+        """Returns stdout."""
+        exit_code, stdout, stderr = self._submit(list(argv), nice=nice)
+        if exit_code != 0:
+            raise LibBorgError(list(argv), exit_code, stderr)
+        return stdout
+
+    def close(self):
+        for worker in self._workers.values():
+            worker.shutdown()
+
+    def dump_arcs(self):
+        try:
+            return self._run('list', '--consider-checkpoints', '--format={id}{NUL}{barchive}{NUL}')
+        except LibBorgError as e:
+            if e.exit_code == EXIT_LOCK_TIMEOUT:
+                raise RepoLockedError from e
+            raise
+
+    def delete_temp_archives(self):
+        self._run('delete', '--glob-archives=*(temp)-*')
+
+    def check(self, on_output_line, *, archives_only=False):
+        """See Borg.check"""
+        argv = ['--verbose', 'check', '--archives-only' if archives_only else '--verify-data']
+        exit_code, stdout, stderr = self._submit(argv, nice=True)
+        # Like the sh backend's _err_to_out. Unlike it, output is only available when the command finishes.
+        output = stdout + stderr
+        for line in output.splitlines(keepends=True):
+            on_output_line(line)
+        if exit_code != 0:
+            raise LibBorgError(argv, exit_code, output)
+
+    def verify_segments(self, segments: set[int]):
+        verified, errors = self._worker(nice=True).submit(_verify_segments, segments).result()
+        if errors:
+            argv = ['verify-segments', f'({len(segments)} segments)']
+            raise LibBorgError(argv, 1, '\n'.join(errors))
+        return verified
+
+    def list_json(self):
+        return self._run('list', '--json', '--consider-checkpoints')
+
+    def delete_archives(self, names: list[str]):
+        self._run('delete', '::', *names)
+
+    def compact(self, threshold):
+        self._run('compact', f'--threshold={threshold}', nice=True)
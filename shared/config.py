@@ -1,22 +1,218 @@
+"""
+config.yml, parsed and validated into dataclasses.
+
+get_config() is cheap to call repeatedly: the file is only parsed again when it changes.
+
+The hook is usually a fresh process, so it looks up pubkeys in a precompiled snapshot instead,
+to skip importing yaml and parsing the whole file.
+"""
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+from dataclasses import dataclass
+from datetime import date
 from pathlib import Path
+from threading import Lock
+from typing import Any
+
+from shared.constants import Paths
+from shared.utils import read_json_state, write_json_state
+
+CONFIG_PATH = Path('config.yml')
+PK_SNAPSHOT_VERSION = 2
+
+
+@dataclass(frozen=True)
+class UserConfig:
+    user: str
+    pubkey: str
+    repo: str
+    ssh: str | None = None  # For automatic backups by borg-daily
+    mac: str | None = None  # WOL for automatic backups
+
+    def __post_init__(self):
+        if not isinstance(self.user, str) or '-' in self.user:
+            msg = f'Invalid username {self.user!r}: must be a string without dashes'
+            raise ValueError(msg)
+
+
+@dataclass(frozen=True)
+class RepoConfig:
+    prune: dict[str, int]
+    compaction_threshold: int = 10
+    # Most GB of live data to rewrite per compaction, by raising the threshold. See daily/compaction.py
+    compaction_max_rewrite_gb: int | None = None
+    mirror_host: str | None = None
+    mirror_mbuffer_size: str | None = None
+    mirror_scrub_weeks: int = 1  # Weeks to spread the checksumming of the mirror over. See daily/scrub.py
+    borg_backend: str = 'sh'  # Or 'library', see shared/borg_lib.py
+    # Physical devices, for borg-daily to not run seek-heavy jobs concurrently on the same one.
+    # Any name; repos with the same device share it. Snapshots are on the repo's device.
+    device: str | None = None  # Defaults to a device of its own
+    mirror_device: str | None = None  # Defaults to mirror_host, so repos mirrored to the same host share it
+    # Weeks to spread `borg check --verify-data` over. See daily/check.py
+    check_weeks: int = 1
+
+    def __post_init__(self):
+        if 'keep_daily' not in self.prune:
+            msg = 'prune must include keep_daily'
+            raise ValueError(msg)
+        too_frequent = {'keep_hourly', 'keep_minutely', 'keep_secondly', 'keep_within'} & self.prune.keys()
+        if too_frequent:
+            msg = f'prune must not include {too_frequent}'
+            raise ValueError(msg)
+        if self.mirror_host and not self.mirror_mbuffer_size:
+            msg = 'mirror_mbuffer_size is required with mirror_host'
+            raise ValueError(msg)
+        if self.borg_backend not in {'sh', 'library'}:
+            msg = f"borg_backend must be 'sh' or 'library', not {self.borg_backend!r}"
+            raise ValueError(msg)
+        for weeks_field in ('check_weeks', 'mirror_scrub_weeks'):
+            weeks = getattr(self, weeks_field)
+            if not isinstance(weeks, int) or weeks < 1:
+                msg = f'{weeks_field} must be a positive integer, not {weeks!r}'
+                raise ValueError(msg)
+        if self.compaction_max_rewrite_gb is not None and (
+            not isinstance(self.compaction_max_rewrite_gb, int) or self.compaction_max_rewrite_gb < 0
+        ):
+            msg = f'compaction_max_rewrite_gb must be a non-negative integer, not {self.compaction_max_rewrite_gb!r}'
+            raise ValueError(msg)
+
+
+@dataclass(frozen=True)
+class Config:
+    users: list[UserConfig]
+    repos: dict[str, RepoConfig]
+    weekly_healthcheck: str
+    smarthealthc: list[tuple[str, str]] = dataclasses.field(default_factory=list)  # (hc_url, disk)
+    smart_max_age_days: int = 7  # Most days to not wake up a disk in standby to read its SMART data
+    force_weekly_until: date | None = None
+    env_device: str = 'env'  # Device of the env files with passphrases
+
+    # Indexes, built in __post_init__:
+    user_by_pubkey: dict[str, UserConfig] = dataclasses.field(init=False)
+    repo_users: dict[str, list[UserConfig]] = dataclasses.field(init=False)
+    repo_auto_users: dict[str, list[UserConfig]] = dataclasses.field(init=False)
+
+    def __post_init__(self):
+        user_by_pubkey = {}
+        repo_users = {}
+        for u in self.users:
+            if u.repo not in self.repos:
+                msg = f'User {u.user} has unknown repo {u.repo}'
+                raise ValueError(msg)
+            if u.pubkey in user_by_pubkey:
+                msg = f'Users {user_by_pubkey[u.pubkey].user} and {u.user} have the same pubkey'
+                raise ValueError(msg)
+            user_by_pubkey[u.pubkey] = u
+            repo_users.setdefault(u.repo, []).append(u)
+
+        # Frozen, so bypass __setattr__ like dataclasses does
+        object.__setattr__(self, 'user_by_pubkey', user_by_pubkey)
+        object.__setattr__(self, 'repo_users', repo_users)
+        object.__setattr__(self, 'repo_auto_users', {
+            repo: [u for u in users if u.ssh]
+            for repo, users in repo_users.items()
+        })
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]):
+        data = dict(data)
+        data['users'] = [_build(UserConfig, u, f'users[{i}]') for i, u in enumerate(data.get('users', []))]
+        data['repos'] = {name: _build(RepoConfig, r, f'repos.{name}') for name, r in data.get('repos', {}).items()}
+        data['smarthealthc'] = [tuple(entry) for entry in data.get('smarthealthc', [])]
+        force_until = data.get('force_weekly_until')
+        if isinstance(force_until, str):
+            data['force_weekly_until'] = date.fromisoformat(force_until)
+        return _build(cls, data, 'config')
 
-import yaml
 
+def _build[T](cls: type[T], data: dict[str, Any], where: str) -> T:
+    init_fields = {f.name for f in dataclasses.fields(cls) if f.init}
+    unknown = data.keys() - init_fields
+    if unknown:
+        msg = f'Unknown keys in {where}: {sorted(unknown)}'
+        raise ValueError(msg)
+    try:
+        return cls(**data)
+    except (TypeError, ValueError) as e:
+        msg = f'Invalid {where}: {e}'
+        raise ValueError(msg) from e
 
-def get_config():
-    with Path('./config.yml').open(encoding='utf-8') as f:
-        return yaml.safe_load(f)
+
+def load_config(path: Path):
+    import yaml
+
+    with path.open(encoding='utf-8') as f:
+        return Config.from_dict(yaml.safe_load(f))
+
+
+def _config_stat_key():
+    st = CONFIG_PATH.stat()
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class _Cache:
+    lock = Lock()
+    key: tuple | None = None
+    config: Config | None = None
+
+
+def get_config() -> Config:
+    key = (CONFIG_PATH, *_config_stat_key())
+    with _Cache.lock:
+        if _Cache.key != key:
+            _Cache.config = load_config(CONFIG_PATH)
+            _Cache.key = key
+        return _Cache.config
 
 
 def get_config_repos():
-    users = get_config()['users']
-    return {u['repo'] for u in users}
+    return set(get_config().repo_users)
+
+
+def _hash_pk(pk: str):
+    return hashlib.sha256(pk.encode('utf-8')).hexdigest()
+
+
+def write_pk_snapshot():
+    """Compiles pubkey -> (repo, user) for the hook. Run by update_authorized_keys.sh."""
+    stat_key = _config_stat_key()
+    snapshot = {
+        'version': PK_SNAPSHOT_VERSION,
+        'config_stat': list(stat_key),
+        'pubkeys': {
+            _hash_pk(pk): [u.repo, u.user]
+            for pk, u in load_config(CONFIG_PATH).user_by_pubkey.items()
+        },
+    }
+    Paths.config_pk_snapshot.parent.mkdir(parents=True, exist_ok=True)
+    write_json_state(Paths.config_pk_snapshot, snapshot)
+    return snapshot['pubkeys']
+
+
+def _read_pk_snapshot():
+    """Returns None if missing or stale."""
+    try:
+        snapshot = read_json_state(Paths.config_pk_snapshot)
+    except ValueError:
+        return None
+    if snapshot.get('version') != PK_SNAPSHOT_VERSION or snapshot.get('config_stat') != list(_config_stat_key()):
+        return None
+    return snapshot['pubkeys']
 
 
 def get_config_from_pk(pk: str):
-    users = get_config()['users']
-    user = next((u for u in users if u['pubkey'] == pk), None)
-    if user:
-        return user['repo'], user['user']
+    pubkeys = _read_pk_snapshot()
+    if pubkeys is None:
+        pubkeys = write_pk_snapshot()  # So that the next hook call is fast
+    repo_user = pubkeys.get(_hash_pk(pk))
+    if repo_user:
+        return tuple(repo_user)
     msg = f'No user with pubkey {pk}'
     raise ValueError(msg)
+
+
+if __name__ == '__main__':
+    write_pk_snapshot()
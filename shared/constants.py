@@ -9,6 +9,10 @@ class RC:
 
 class Paths:
     base_state = Path('state')
+    config_pk_snapshot = base_state / 'config_pk.json'
+    hc_outbox = base_state / 'hc_outbox.json'  # Undelivered healthcheck pings, see daily/healthcheck.py
+    smart_cache = base_state / 'smart.json'  # Last results of disks, see daily/smarthealthc.py
+    hook_socket = Path('/run/tamborg-hook/hook.sock')
 
     def __init__(self, repo: str):
         self.repo_state = self.base_state / repo
@@ -16,10 +20,15 @@ class Paths:
         self.repo_enabled = self.repo_state / 'enabled'
 
         self.lock = self.repo_state / 'lock'
-        self.lock_prev_arcs = self.lock / 'prev_arcs.bin'
+        self.lock_prev_digest = self.lock / 'prev_arcs.digest'
         self.lock_user = self.lock / 'user.txt'
 
-        self.pubsub = self.repo_state / 'pubsub.fifo'
+        self.pubsub = self.repo_state / 'pubsub'  # Dir of subscriber sockets
+        self.waiting_for = self.repo_state / 'waiting_for'  # See shared/waiting_for.py
+        self.check_state = self.repo_state / 'check.json'
+        self.mirror_manifest = self.repo_state / 'mirror_manifest.json'
+        self.mirror_scrub = self.repo_state / 'mirror_scrub.json'
+        self.segment_hashes = self.repo_state / 'segment_hashes.json'
 
         self.env = Path('/home/borg/env') / repo
         self.repo = Path('/home/borg') / repo
@@ -1,72 +1,181 @@
 """
-A simple pubsub with pipes, for a single subscriber only.
+A simple pubsub with Unix datagram sockets, one per subscriber, in paths.pubsub.
+
+The kernel queue of a socket is short (net.unix.max_dgram_qlen, usually 10 datagrams), and a publisher
+can't wait for it. So a subscriber created on an event loop drains its socket into an in-process queue
+as soon as messages arrive, and none are lost between async_wait_for() calls.
+Subscribe before triggering whatever publishes the awaited message.
 """
 from __future__ import annotations
 
 import contextlib
 import os
 import select
+import socket
 import time
-from queue import Empty, Queue
-from threading import Thread
+from collections import deque
+from itertools import count
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
+    from collections.abc import Callable
+
     from .constants import Paths
 
+MAX_MESSAGE = 4096
+_sub_ids = count()
 
-class PubSub(Thread):
-    def __init__(self, paths: Paths, *, start: bool):
-        super().__init__(daemon=True, name=str(paths.pubsub))
+
+class PubSub:
+    def __init__(self, paths: Paths, *, subscribe: bool, keep: Callable[[str], bool] | None = None):
+        """keep: filters the messages to queue, so that a subscriber that's idle for long doesn't pile up others."""
         self.paths = paths
-        self.sub_queue = Queue[str]()
-        with contextlib.suppress(FileExistsError):
-            os.mkfifo(self.paths.pubsub)
-        if start:
-            self.start()
+        self.keep = keep
+        self.sock: socket.socket | None = None
+        self.sock_path = None
+        self.pending: deque[str] = deque()  # Drained from the socket, not yet awaited
+        self._loop = None
+        self._readable = None
+        if subscribe:
+            self.paths.pubsub.mkdir(exist_ok=True)
+            self.sock_path = self.paths.pubsub / f'{os.getpid()}-{next(_sub_ids)}.sock'
+            with contextlib.suppress(FileNotFoundError):
+                self.sock_path.unlink()
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.bind(str(self.sock_path))
+            self.sock.setblocking(False)  # noqa: FBT003  # For asyncio
+            self._drain_on_loop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc_info):
+        self.close()
+
+    def _drain_on_loop(self):
+        """If there's a running event loop, drains the socket whenever it's readable, so its queue never fills up."""
+        import asyncio  # Not at the top, the hook only publishes and must start fast
 
-    def publish(self, message: str):
         try:
-            fd = os.open(self.paths.pubsub, os.O_WRONLY | os.O_NONBLOCK)
-            with os.fdopen(fd, 'w') as pipe:
-                pipe.write(message + '\n')
-        except OSError:
-            # No subscriber
-            pass
-
-    def run(self):
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Drained by wait_for() calls only
+        self._loop = loop
+        self._readable = asyncio.Event()
+        loop.add_reader(self.sock, self._drain)
+
+    def _drain(self):
         while True:
-            with self.paths.pubsub.open('r') as pipe:
-                while True:
-                    rlist, _, _ = select.select([pipe], [], [])
-                    if not rlist:
-                        break
-                    line = pipe.readline().strip()
-                    if not line:
-                        # Pipe closed (EOF)
-                        break
-                    self.sub_queue.put(line)
+            try:
+                data = self.sock.recv(MAX_MESSAGE)
+            except BlockingIOError:
+                break
+            message = data.decode('utf-8')
+            if self.keep is None or self.keep(message):
+                self.pending.append(message)
+        if self._readable and self.pending:
+            self._readable.set()
+
+    def _take(self, prefix: str | None, match: str | tuple[str, ...] | None):
+        """Pops pending messages up to the first one that matches."""
+        while self.pending:
+            result = _matches(self.pending.popleft(), prefix, match)
+            if result:
+                return result
+        return None
+
+    def close(self):
+        if self.sock:
+            if self._loop:
+                self._loop.remove_reader(self.sock)
+                self._loop = None
+            self.sock.close()
+            self.sock = None
+            with contextlib.suppress(FileNotFoundError):
+                self.sock_path.unlink()
+
+    def fileno(self):
+        """For select()."""
+        return self.sock.fileno()
+
+    def publish(self, message: str):
+        """Returns the subscribers that missed the message because their queue was full."""
+        try:
+            sub_paths = list(self.paths.pubsub.iterdir())
+        except FileNotFoundError:
+            return []  # No subscriber ever
+        missed = []
+        data = message.encode('utf-8')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            for sub_path in sub_paths:
+                try:
+                    sock.sendto(data, socket.MSG_DONTWAIT, str(sub_path))
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Left behind by a subscriber that didn't close()
+                    with contextlib.suppress(FileNotFoundError):
+                        sub_path.unlink()
+                except BlockingIOError:
+                    missed.append(sub_path.name)  # Subscriber's queue is full, it's not reading
+        return missed
+
+    def receive(self):
+        """Returns one queued message, without blocking. Raises BlockingIOError if there's none."""
+        self._drain()
+        if not self.pending:
+            raise BlockingIOError
+        return self.pending.popleft()
 
     def wait_for(
         self,
         *,
         prefix: str | None = None,
-        match: str | None = None,
+        match: str | tuple[str, ...] | None = None,  # One or any of several messages
         timeout: float | None = None,  # in seconds; None => wait forever
     ):
         deadline = None if timeout is None else time.monotonic() + timeout
         remaining = None
 
         while True:
+            self._drain()
+            result = self._take(prefix, match)
+            if result:
+                return result
             if deadline is not None:
                 remaining = deadline - time.monotonic()
                 if remaining <= 0:
                     return None
-            try:
-                message = self.sub_queue.get(timeout=remaining)
-            except Empty:
+            rlist, _, _ = select.select([self.sock], [], [], remaining)
+            if not rlist:
                 return None
-            if prefix and message.startswith(prefix):
-                return message
-            if match and match == message:
-                return True
+
+    async def async_wait_for(
+        self,
+        *,
+        prefix: str | None = None,
+        match: str | tuple[str, ...] | None = None,  # One or any of several messages
+        timeout: float | None = None,  # in seconds; None => wait forever
+    ):
+        """Like wait_for, without blocking the event loop."""
+        import asyncio
+
+        if not self._loop:
+            self._drain_on_loop()
+        try:
+            async with asyncio.timeout(timeout):
+                while True:
+                    self._drain()
+                    result = self._take(prefix, match)
+                    if result:
+                        return result
+                    self._readable.clear()
+                    await self._readable.wait()
+        except TimeoutError:
+            return None
+
+
+def _matches(message: str, prefix: str | None, match: str | tuple[str, ...] | None):
+    if prefix and message.startswith(prefix):
+        return message
+    if match and message in ((match,) if isinstance(match, str) else match):
+        return message
+    return None
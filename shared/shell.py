@@ -1,47 +1,125 @@
+from __future__ import annotations
+
 import os
+import shlex
 import sys
+import time
 from contextlib import contextmanager
 from pathlib import Path
+from threading import Lock, Timer
+from typing import TYPE_CHECKING, ClassVar
 
 import sh
 
-from shared.constants import Paths
+if TYPE_CHECKING:
+    from shared.constants import Paths
 
 nice = sh.nice.bake('-n19', 'ionice', '-c3')
 
 
+class RepoLockedError(Exception):
+    pass
+
+
+class _PassphraseCache:
+    lock = Lock()
+    entries: ClassVar[dict[Path, tuple[str, float]]] = {}  # env path: (passphrase, monotonic time read)
+    evictions: ClassVar[dict[Path, Timer]] = {}
+
+
+def _evict_passphrase(env_path: Path, read_time: float):
+    with _PassphraseCache.lock:
+        cached = _PassphraseCache.entries.get(env_path)
+        if cached and cached[1] == read_time:
+            del _PassphraseCache.entries[env_path]
+            del _PassphraseCache.evictions[env_path]
+
+
+def get_passphrase(env_path: Path, ttl: float | None = None):
+    """
+    Sources the repo's env file once, instead of a BORG_PASSCOMMAND bash for every borg call.
+    (The env file may be on another HDD, which may have to spin up.)
+    ttl: seconds to keep the passphrase in memory, after which it's dropped. None keeps it for the whole process.
+    """
+    with _PassphraseCache.lock:
+        cached = _PassphraseCache.entries.get(env_path)
+        if cached and (ttl is None or time.monotonic() - cached[1] < ttl):
+            return cached[0]
+        passphrase = sh.bash('-c', f'source {shlex.quote(str(env_path))} && printf %s "$BORG_PASSPHRASE"')
+        read_time = time.monotonic()
+        _PassphraseCache.entries[env_path] = (passphrase, read_time)
+        if ttl is not None:
+            previous = _PassphraseCache.evictions.pop(env_path, None)
+            if previous:
+                previous.cancel()
+            timer = Timer(ttl, _evict_passphrase, (env_path, read_time))
+            timer.daemon = True
+            timer.start()
+            _PassphraseCache.evictions[env_path] = timer
+        return passphrase
+
+
 class Borg:
-    def __init__(self, paths: Paths):
+    def __init__(self, paths: Paths, passphrase_ttl: float | None = None):
         env = os.environ.copy()
         env['BORG_REPO'] = str(paths.repo)
-        env['BORG_PASSCOMMAND'] = f'bash -c "source {paths.env} && echo $BORG_PASSPHRASE"'
-        self._borg = sh.borg.bake(_env=env)
-        self._nice_borg = nice.borg.bake(_env=env)
-        self.with_lock = self._borg.bake('with-lock', '::')
-
-    def is_repo_unlocked(self):
+        env['BORG_EXIT_CODES'] = 'modern'  # To tell LockTimeout apart
+        self.env = env
+        self.env_path = paths.env
+        self.passphrase_ttl = passphrase_ttl
+        self._borg = sh.borg
+        self._nice_borg = nice.borg
+
+    def passphrase(self):
+        return get_passphrase(self.env_path, self.passphrase_ttl)
+
+    def _call(self, cmd: sh.Command, *args, **kwargs):
+        """Runs borg with the passphrase in BORG_PASSPHRASE_FD, a pipe that's already written and closed."""
+        read_fd, write_fd = os.pipe()
         try:
-            self.with_lock('true', _no_out=True)
-            return True
-        except sh.ErrorReturnCode:
-            return False
+            try:
+                os.write(write_fd, self.passphrase().encode('utf-8'))
+            finally:
+                os.close(write_fd)
+            os.set_inheritable(read_fd, True)  # noqa: FBT003
+            env = {**self.env, 'BORG_PASSPHRASE_FD': str(read_fd)}
+            return cmd(*args, _env=env, _pass_fds={read_fd}, **kwargs)
+        finally:
+            os.close(read_fd)
+
+    def with_lock(self, *cmd, **kwargs):
+        return self._call(self._borg, 'with-lock', '::', *cmd, **kwargs)
 
     def dump_arcs(self):
-        return self._borg.list(
-            # Separates with {NUL} ('\x00') because it's the only forbidden character
-            # in archive names.
-            format='{id}{NUL}{barchive}{NUL}',
-            consider_checkpoints=True,
-        )
+        """
+        Raises RepoLockedError if another borg process holds the repo lock,
+        so that it also replaces a separate `borg with-lock :: true` check.
+        (Unlike with-lock, it doesn't fail on other readers' shared locks, but those don't modify the repo.)
+        """
+        try:
+            return self._call(
+                self._borg.list,
+                # Separates with {NUL} ('\x00') because it's the only forbidden character
+                # in archive names.
+                format='{id}{NUL}{barchive}{NUL}',
+                consider_checkpoints=True,
+            )
+        except sh.ErrorReturnCode_73 as e:  # LockTimeout
+            raise RepoLockedError from e
 
     def delete_temp_archives(self):
-        self._borg.delete(glob_archives='*(temp)-*')
-
-    def check(self, on_output_line):
-        self._nice_borg(
+        self._call(self._borg.delete, glob_archives='*(temp)-*')
+
+    def check(self, on_output_line, *, archives_only=False):
+        """
+        archives_only: check only the archives' metadata, without reading the data chunks nor the segments.
+        Otherwise, everything is read, and also decrypted and authenticated with --verify-data.
+        """
+        self._call(
+            self._nice_borg,
             '--verbose',
             'check',
-            '--verify-data',
+            '--archives-only' if archives_only else '--verify-data',
             _out=on_output_line,
             _err_to_out=True,
         )
@@ -51,11 +129,27 @@ class Borg:
         #   which are authenticating the metadata and the data chunks.
         # Source: https://github.com/borgbackup/borg/issues/2251#issuecomment-284189633
 
-    def prune(self, user, **kwargs):
-        self._borg.prune(glob_archives=f'{user}-*', **kwargs)
+    def verify_segments(self, segments: set[int]):
+        """Deep-verifies some segments only, with shared/verify_segments.py. Returns how many were verified."""
+        verified = self._call(
+            self._nice_borg,
+            'with-lock', '::', sys.executable, '-m', 'shared.verify_segments',
+            _in='\0'.join([self.passphrase(), *map(str, sorted(segments))]),
+        )
+        return int(str(verified))
+
+    def list_json(self):
+        return str(self._call(self._borg.list, json=True, consider_checkpoints=True))
+
+    def delete_archives(self, names: list[str]):
+        """A single `borg delete` for all the archives, so the manifest is written once."""
+        self._call(self._borg.delete, '::', *names)
 
     def compact(self, threshold):
-        self._nice_borg.compact(threshold=threshold)
+        self._call(self._nice_borg.compact, threshold=threshold)
+
+    def close(self):
+        pass
 
 
 class Mirror:
@@ -64,6 +158,8 @@ class Mirror:
     CURRENT_NEW = MOUNT_POINT / 'current.new'
     CHECKED = MOUNT_POINT / 'checked'
     CHECKED_NEW = MOUNT_POINT / 'checked.new'
+    BULK_LINK = Path('/bulk_link.py')
+    VERIFY_HASHES = Path('/verify_hashes.py')
 
     def __init__(self, host: str):
         ssh_opts = [
@@ -80,7 +176,6 @@ class Mirror:
 
         rsync_rsh = ' '.join(['hpnssh', *ssh_opts])
         self.rsync = sh.rsync.bake('-hhh', rsh=rsync_rsh, stats=True, _out=sys.stdout, _err_to_out=True)
-        self.nice_stdout_rsync = nice.rsync.bake(rsh=rsync_rsh, _err=sys.stderr)
 
     @contextmanager
     def mount(self):
@@ -94,4 +189,22 @@ class Mirror:
     def promote(self, source, dest):
         self.ssh(f'rm -rf {dest} && mv {source} {dest}')
 
+    def bulk_link(self, source, dest, rel_paths: list[str]):
+        """Hardlinks rel_paths from source to dest, with mirror_server/bulk_link.py. Returns the ones not in source."""
+        missing_out = self.ssh(
+            f'python3 {self.BULK_LINK} {source} {dest}',
+            _in=''.join(p + '\0' for p in rel_paths),
+            _err=sys.stderr,
+        )
+        return [p for p in missing_out.split('\0') if p]
+
+    def verify_hashes(self, base, hashes: dict[str, str]):
+        """Returns the files in base whose sha256 doesn't match, with mirror_server/verify_hashes.py"""
+        damaged_out = self.ssh(
+            f'nice -n19 python3 {self.VERIFY_HASHES} {base}',
+            _in=''.join(f'{p}\0{h}\0' for p, h in hashes.items()),
+            _err=sys.stderr,
+        )
+        return [p for p in damaged_out.split('\0') if p]
+
     # TODO: test if the mirrored repo is usable
@@ -1,12 +1,17 @@
 from __future__ import annotations
 
+import json
 import logging
 import os
 import sys
+import threading
 from enum import Enum
+from typing import TYPE_CHECKING
 
 from systemd import journal
-from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_fixed
+
+if TYPE_CHECKING:
+    from pathlib import Path
 
 
 class LoggerPurpose(Enum):
@@ -42,16 +47,41 @@ def get_logger(name: str, purpose: LoggerPurpose):
     return logger
 
 
-@retry(
-    retry=retry_if_exception_type(FileExistsError),
-    wait=wait_fixed(1),
-    stop=stop_after_attempt(4),
-    reraise=True,
-)
 def mkdir_lock(paths):
     """
     When two ssh commands are executed consecutively,
     the first close_session is executed about 0.5s after the second open_session.
     So retry for 3s so the late hook can finish releasing.
     """
-    paths.lock.mkdir()
+    # Imported here to keep it out of the hook's close_session path.
+    from tenacity import (
+        Retrying,
+        retry_if_exception_type,
+        stop_after_attempt,
+        wait_fixed,
+    )
+
+    for attempt in Retrying(
+        retry=retry_if_exception_type(FileExistsError),
+        wait=wait_fixed(1),
+        stop=stop_after_attempt(4),
+        reraise=True,
+    ):
+        with attempt:
+            paths.lock.mkdir()
+
+
+def read_json_state(path: Path):
+    """Returns {} if missing, so that the first run starts from scratch."""
+    try:
+        return json.loads(path.read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def write_json_state(path: Path, state: dict):
+    """Atomically, so that a crash leaves either the old or the new state."""
+    # Per thread too, for concurrent writers in the threaded hook service
+    tmp = path.with_suffix(f'.tmp{os.getpid()}-{threading.get_ident()}')
+    tmp.write_text(json.dumps(state))
+    tmp.replace(path)
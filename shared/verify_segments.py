@@ -0,0 +1,53 @@
+'''
+Deep-verifies some segments of a repo: reads every object, and verifies its CRC, and then its MAC and id by decrypting it.
+Like `borg check --verify-data` does, but for some segments only. See daily/check.py.
+
+Runs in the worker of the library backend, or for the sh backend, under the repo lock:
+
+    borg with-lock :: python -m shared.verify_segments
+
+with the passphrase and the segment numbers in stdin, separated by NUL.
+Prints the number of segments verified, and the errors found to stderr, failing if there's any.
+'''
+from __future__ import annotations
+
+import os
+import sys
+
+
+def verify_segments(repo: str, segments: set[int], *, lock: bool):
+    '''
+    lock: False under `borg with-lock`, which already holds it.
+    Returns the number of segments verified and the errors found.
+    '''
+    from borg.helpers import Manifest
+    from borg.logger import setup_logging
+    from borg.repository import TAG_PUT, Repository
+
+    setup_logging()  # Like a borg command, as borg's modules log
+    verified = 0
+    errors = []
+    with Repository(repo, exclusive=False, lock=lock) as repository:
+        _manifest, key = Manifest.load(repository, Manifest.NO_OPERATION_CHECK)
+        for segment, _filename in repository.io.segment_iterator():
+            if segment not in segments:
+                continue
+            try:
+                for tag, obj_id, _offset, data in repository.io.iter_objects(segment, include_data=True):
+                    if tag == TAG_PUT:
+                        # Like borg check --verify-data: the manifest's id isn't a hash of its data
+                        key.decrypt(None if obj_id == Manifest.MANIFEST_ID else obj_id, data)
+            except Exception as e:
+                errors.append(f'Segment {segment}: {e!r}')
+            verified += 1
+    return verified, errors
+
+
+if __name__ == '__main__':
+    _passphrase, *_segments = sys.stdin.read().split('\0')
+    os.environ['BORG_PASSPHRASE'] = _passphrase
+    _verified, _errors = verify_segments(os.environ['BORG_REPO'], {int(s) for s in _segments}, lock=False)
+    for _error in _errors:
+        sys.stderr.write(f'{_error}\n')
+    sys.stdout.write(f'{_verified}\n')
+    sys.exit(1 if _errors else 0)
@@ -0,0 +1,53 @@
+'''
+`waiting_for` is published by borg-daily in state/<repo>/waiting_for, for the hook to read without networking.
+
+The file is replaced atomically, and carries a liveness token of the borg-daily process that wrote it:
+boot id, pid and the process start time. If that process ended (even without cleaning up, or the machine rebooted),
+the token doesn't match anymore, and the file is ignored. So stale data isn't served, like with the http server.
+'''
+from __future__ import annotations
+
+import os
+from functools import cache
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from shared.utils import read_json_state, write_json_state
+
+if TYPE_CHECKING:
+    from shared.constants import Paths
+
+
+@cache
+def boot_id():
+    return Path('/proc/sys/kernel/random/boot_id').read_text(encoding='ascii').strip()
+
+
+def process_token(pid: int):
+    """'<boot_id> <pid> <start time>', or None if the process doesn't exist."""
+    try:
+        stat = Path(f'/proc/{pid}/stat').read_text(encoding='utf-8', errors='replace')
+    except OSError:  # Missing, or hidden by hidepid
+        return None
+    # The command name (2nd field) may have spaces and parentheses, so split after its last ')'
+    start_time = stat.rpartition(')')[2].split()[19]  # Field 22
+    return f'{boot_id()} {pid} {start_time}'
+
+
+def write_waiting_for(paths: Paths, user: str | None):
+    if user:
+        write_json_state(paths.waiting_for, {'token': process_token(os.getpid()), 'user': user})
+    else:
+        paths.waiting_for.unlink(missing_ok=True)
+
+
+def read_waiting_for(paths: Paths) -> str | None:
+    """Any unexpected content is just ignored, like a missing file."""
+    try:
+        state = read_json_state(paths.waiting_for)
+        token = state['token']
+        user = state['user']
+        alive = process_token(int(token.split(' ')[1])) == token
+    except (ValueError, TypeError, KeyError, IndexError, AttributeError):
+        return None
+    return user if alive and isinstance(user, str) else None
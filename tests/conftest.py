@@ -6,12 +6,16 @@ from pathlib import Path
 
 import pytest
 import sh
-import yaml
 from tenacity import wait_fixed
 
-import hook
+import hook.main
+import hook.utils
 from shared import config, shell
+from shared.borg_lib import LibBorg
 from shared.constants import Paths
+from shared.shell import Borg
+
+REPO_ROOT = Path(__file__).parent.parent
 
 
 def mkfile(path: Path):
@@ -20,10 +24,7 @@ def mkfile(path: Path):
 
 @pytest.fixture(autouse=True)
 def use_test_config(monkeypatch):
-    with Path('./config.test.yml').open(encoding='utf-8') as f:
-        test_config = yaml.safe_load(f)
-
-    monkeypatch.setattr(config, 'get_config', lambda: test_config)
+    monkeypatch.setattr(config, 'CONFIG_PATH', Path('./config.test.yml').absolute())
 
 
 @pytest.fixture
@@ -89,3 +90,26 @@ def tenacity_zero_wait(monkeypatch):
 def none_waiting_for(monkeypatch):
     monkeypatch.setattr(hook.utils, 'get_waiting_for', lambda _repo: None)
     monkeypatch.setattr(hook.main, 'get_waiting_for', lambda _repo: None)
+
+
+@pytest.fixture
+def backends(monkeypatch, paths: Paths):
+    """The sh and library backends on the same repo, with two archives and a checkpoint. Requires borg."""
+    monkeypatch.setattr(shell, 'sh', sh)
+    monkeypatch.setenv('BORG_BASE_DIR', str(Path('base').absolute()))
+    # For `python -m shared.verify_segments`, as tests run in a temporary dir
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join([str(REPO_ROOT), os.environ.get('PYTHONPATH', '')]))
+    paths.repo = Path('repo').absolute()
+    paths.repo_data = paths.repo / 'data'
+    paths.env = Path('env').absolute()
+    paths.env.write_text("BORG_PASSPHRASE='pass phrase'\n")
+
+    cli = sh.borg.bake(_env={**os.environ, 'BORG_REPO': str(paths.repo), 'BORG_PASSPHRASE': 'pass phrase'})
+    cli.init(encryption='repokey')
+    Path('src').mkdir()
+    for name in ('TAM_2009-1', 'TAM_2009-2.checkpoint', 'AMGS-1'):
+        cli.create(f'::{name}', 'src')
+
+    lib_borg = LibBorg(paths)
+    yield cli, Borg(paths), lib_borg
+    lib_borg.close()
@@ -2,26 +2,32 @@ import pytest
 
 import hook
 from hook.main import main
+from hook.utils import arcs2str, arcs_digest
 from shared.constants import RC, Paths
-from shared.shell import Borg
+from shared.pubsub import PubSub
+from shared.shell import Borg, RepoLockedError
 
 
 class TestAcquireLock:
+    dummy_arcs = (
+        ('id1', 'TAM_2009-asdf'),
+        ('id2', 'TAM_2009(temp)-2026-01-01'),
+        ('id3', 'old_laptop-asdf'),
+    )
+
     @pytest.fixture(autouse=True)
     def pam_type_open_session(self, monkeypatch):
         monkeypatch.setenv('PAM_TYPE', 'open_session')
 
     @pytest.fixture(autouse=True)
     def dump_dummy_arcs(self, monkeypatch):
-        monkeypatch.setattr(Borg, 'dump_arcs', lambda _self: 'dummy_archives')
+        monkeypatch.setattr(Borg, 'dump_arcs', lambda _self: arcs2str(self.dummy_arcs))
 
     @pytest.fixture
     def borg_repo_locked(self, monkeypatch):
-        monkeypatch.setattr(Borg, 'is_repo_unlocked', lambda _self: False)
-
-    @pytest.fixture
-    def borg_repo_unlocked(self, monkeypatch):
-        monkeypatch.setattr(Borg, 'is_repo_unlocked', lambda _self: True)
+        def raise_locked(_self):
+            raise RepoLockedError
+        monkeypatch.setattr(Borg, 'dump_arcs', raise_locked)
 
     def run_main(self):
         main(['main.py', 'pam'])
@@ -33,15 +39,16 @@ class TestAcquireLock:
             self.run_main()
         assert e.value.code == RC.access_denied
 
-    def test_deny_on_waiting_for_other(self, monkeypatch):
+    def test_deny_on_waiting_for_other(self, monkeypatch, paths: Paths):
         monkeypatch.setattr(hook.utils, 'get_waiting_for', lambda _repo: 'other')
         monkeypatch.setattr(hook.main, 'get_waiting_for', lambda _repo: 'other')
 
-        with pytest.raises(SystemExit) as e:
-            self.run_main()
-        assert e.value.code == RC.access_denied
+        with PubSub(paths, subscribe=True) as sub:
+            with pytest.raises(SystemExit) as e:
+                self.run_main()
+            assert e.value.code == RC.access_denied
+            assert sub.wait_for(match='lock_denied TAM_2009', timeout=0.1)  # For borg-daily to know WOL worked
 
-    @pytest.mark.usefixtures('borg_repo_unlocked')
     def test_allow_when_waiting_for_me(self, monkeypatch):
         monkeypatch.setattr(hook.utils, 'get_waiting_for', lambda _repo: 'TAM_2009')
         monkeypatch.setattr(hook.main, 'get_waiting_for', lambda _repo: 'TAM_2009')
@@ -49,12 +56,21 @@ class TestAcquireLock:
         self.run_main()     # Should not raise
 
     @pytest.mark.usefixtures('borg_repo_locked')
-    def test_deny_on_locked_borg(self):
+    def test_deny_on_locked_borg(self, paths: Paths):
         with pytest.raises(SystemExit) as e:
             self.run_main()
         assert e.value.code == RC.access_denied
+        assert not paths.lock.is_dir()
+
+    def test_unlock_on_borg_error(self, monkeypatch, paths: Paths):
+        def raise_error(_self):
+            raise RuntimeError  # For example, borg < 1.4 returns rc 2 instead of 73 on LockTimeout
+        monkeypatch.setattr(Borg, 'dump_arcs', raise_error)
+
+        with pytest.raises(RuntimeError):
+            self.run_main()
+        assert not paths.lock.is_dir()
 
-    @pytest.mark.usefixtures('borg_repo_unlocked')
     def test_deny_on_locked_state(self, paths: Paths):
         paths.lock.mkdir()
         paths.lock_user.write_text('TAM_2009')
@@ -63,9 +79,8 @@ class TestAcquireLock:
             self.run_main()
         assert e.value.code == RC.access_denied
 
-    @pytest.mark.usefixtures('borg_repo_unlocked')
     def test_lock_contents(self, paths: Paths):
         self.run_main()
 
         assert paths.lock_user.read_text() == 'TAM_2009'
-        assert paths.lock_prev_arcs.read_text() == 'dummy_archives'
+        assert paths.lock_prev_digest.read_text() == arcs_digest([self.dummy_arcs[0], self.dummy_arcs[2]])
@@ -0,0 +1,95 @@
+import importlib.util
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import pytest
+import sh
+
+from hook.main import Hook
+from hook.utils import arcs2str, arcs_digest
+from shared.constants import Paths
+from shared.shell import Borg
+
+REPO_ROOT = Path(__file__).parent.parent
+
+# In a subprocess, because modules imported by other tests are cached in sys.modules
+python = sh.Command(sys.executable).bake(_cwd=REPO_ROOT)
+
+
+class TestHookStartup:
+    # Hook latency is added to every client's connect and disconnect.
+    # hook.main used to take ~180ms to import, mostly because of requests and sh.
+    BUDGET_US = 100_000
+
+    def import_time_us(self):
+        stderr = python('-X', 'importtime', '-c', 'import hook.main', _return_cmd=True).stderr.decode()
+        for line in stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            _self_us, cumulative_us, package = line.removeprefix('import time:').split('|')
+            if package.strip() == 'hook.main':
+                return int(cumulative_us)
+        msg = f'hook.main not found in importtime output:\n{stderr}'
+        raise AssertionError(msg)
+
+    def test_import_time(self):
+        best_us = min(self.import_time_us() for _ in range(3))
+        assert best_us < self.BUDGET_US
+
+    def test_lazy_imports(self):
+        stdout = python('-c', 'import sys, hook.main; print(*sys.modules)')
+        imported = set(stdout.split())
+        assert imported.isdisjoint({'requests', 'tenacity', 'sh'})
+
+
+class TestArchiveDump:
+    # check_repo runs at close_session, so slow parsing is felt as slow logouts.
+    # The previous str.partition parser was quadratic: ~20s per parse of this dump, and it parsed twice.
+    ARCHIVES = 50_000
+    NEW_ARCHIVES = 10
+    BUDGET_S = 0.5
+
+    def test_check_repo(self, monkeypatch, paths: Paths):
+        prev_arcs = [
+            (f'{i:064x}', f'user{i % 3}-2026-01-01T00:00:00.{i:06}')
+            for i in range(self.ARCHIVES - self.NEW_ARCHIVES)
+        ]
+        new_arcs = [(f'new{i:061x}', f'user1-{i}') for i in range(self.NEW_ARCHIVES)]
+        dump = arcs2str(prev_arcs + new_arcs)
+        monkeypatch.setattr(Borg, 'dump_arcs', lambda _self: dump)
+
+        paths.lock.mkdir()
+        paths.lock_user.write_text('user1')
+        paths.lock_prev_digest.write_text(arcs_digest(prev_arcs))
+
+        start = time.perf_counter()
+        new_count = Hook('TAM').check_repo('user1')
+        elapsed = time.perf_counter() - start
+
+        assert new_count == self.NEW_ARCHIVES
+        assert elapsed < self.BUDGET_S
+
+
+@pytest.mark.skipif(
+    not shutil.which('borg') or not importlib.util.find_spec('borg'),
+    reason='borg not installed, or not importable',
+)
+class TestLibBorg:
+    # borg_backend: library saves the interpreter startup and imports of each borg command.
+    # Measured ~0.25s with sh and ~0.12s with the library per `borg list` of a small repo.
+    COMMANDS = 5
+    MIN_SPEEDUP = 1.5
+
+    def seconds_per_command(self, borg: Borg):
+        borg.list_json()  # Starts the worker, for the library
+        start = time.perf_counter()
+        for _ in range(self.COMMANDS):
+            borg.list_json()
+        return (time.perf_counter() - start) / self.COMMANDS
+
+    def test_faster_than_sh(self, backends):
+        _cli, sh_borg, lib_borg = backends
+        sh_seconds = self.seconds_per_command(sh_borg)
+        lib_seconds = self.seconds_per_command(lib_borg)
+        assert lib_seconds * self.MIN_SPEEDUP < sh_seconds
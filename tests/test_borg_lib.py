@@ -0,0 +1,73 @@
+import contextlib
+import importlib.util
+import shutil
+
+import pytest
+import sh
+
+from daily.check import segment_fingerprints
+from shared.borg_lib import LibBorgError
+from shared.constants import Paths
+from shared.shell import RepoLockedError
+
+pytestmark = pytest.mark.skipif(
+    not shutil.which('borg') or not importlib.util.find_spec('borg'),
+    reason='borg not installed, or not importable',
+)
+
+
+def test_same_output(backends):
+    _cli, sh_borg, lib_borg = backends
+    assert lib_borg.dump_arcs() == str(sh_borg.dump_arcs())
+    assert lib_borg.list_json() == sh_borg.list_json()
+
+
+def test_repo_locked(backends):
+    cli, sh_borg, lib_borg = backends
+    holder = cli('with-lock', '::', 'sleep', '10', _bg=True)
+    try:
+        for borg in (sh_borg, lib_borg):
+            with pytest.raises(RepoLockedError):
+                borg.dump_arcs()
+    finally:
+        holder.terminate()
+        with contextlib.suppress(sh.ErrorReturnCode, sh.SignalException):
+            holder.wait()
+
+
+def test_same_exit_code(backends, paths: Paths):
+    _cli, sh_borg, lib_borg = backends
+    paths.repo.rename('moved')
+    with pytest.raises(sh.ErrorReturnCode) as sh_error:
+        sh_borg.list_json()
+    with pytest.raises(LibBorgError) as lib_error:
+        lib_borg.list_json()
+    assert lib_error.value.exit_code == sh_error.value.exit_code
+
+
+def test_check(backends):
+    _cli, sh_borg, lib_borg = backends
+    for borg in (sh_borg, lib_borg):
+        for archives_only in (True, False):
+            lines = []
+            borg.check(lines.append, archives_only=archives_only)
+            assert any('Archive consistency check complete' in line for line in lines)
+
+
+@pytest.mark.parametrize('backend', ['sh', 'library'])
+def test_verify_segments(backends, paths: Paths, backend: str):
+    _cli, sh_borg, lib_borg = backends
+    borg = sh_borg if backend == 'sh' else lib_borg
+    segments = {int(s): fp for s, fp in segment_fingerprints(paths).items()}
+    assert borg.verify_segments(set(segments)) == len(segments)
+
+    # Flip a byte in the middle of the biggest segment
+    biggest = max(segments, key=lambda s: segments[s][2])
+    [segment_path] = paths.repo_data.glob(f'*/{biggest}')
+    data = bytearray(segment_path.read_bytes())
+    data[len(data) // 2] ^= 0xFF
+    segment_path.write_bytes(data)
+
+    assert borg.verify_segments(set(segments) - {biggest}) == len(segments) - 1
+    with pytest.raises((LibBorgError, sh.ErrorReturnCode), match=f'Segment {biggest}:'):
+        borg.verify_segments({biggest})
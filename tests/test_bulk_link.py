@@ -0,0 +1,15 @@
+from pathlib import Path
+
+from mirror_server.bulk_link import bulk_link
+
+
+def test_bulk_link():
+    current = Path('current')
+    (current / '0').mkdir(parents=True)
+    (current / '0/1').write_text('1')
+    (current / '0/2').write_text('2')
+
+    missing = bulk_link(current, Path('checked.new'), ['0/1', '0/2', '1/3', 'index.3'])
+    assert missing == ['1/3', 'index.3']
+    assert Path('checked.new/0/1').samefile(current / '0/1')
+    assert Path('checked.new/1').is_dir()
@@ -0,0 +1,47 @@
+import dataclasses
+import logging
+from pathlib import Path
+
+import pytest
+
+from daily.compaction import (
+    CompactionPlan,
+    compaction_threshold,
+    plan_compaction,
+    read_compact_hints,
+)
+from shared.config import get_config
+from shared.constants import Paths
+
+SIZES = {1: 500, 2: 500, 3: 500, 4: 500}
+FREEABLE = {1: 450, 2: 300, 3: 150, 4: 0, 5: 100}  # 5 isn't in the repo anymore
+
+
+def test_plan_compaction():
+    # Everything above the threshold fits in the cap
+    assert plan_compaction(FREEABLE, SIZES, 20, 1000) == CompactionPlan(20, 3, 900, 600)
+    # Segment 3 (30% freeable) would rewrite 350 bytes, so it's left for later
+    assert plan_compaction(FREEABLE, SIZES, 20, 300) == CompactionPlan(30, 2, 750, 250)
+    assert plan_compaction(FREEABLE, SIZES, 20, 50) == CompactionPlan(60, 1, 450, 50)
+    assert plan_compaction(FREEABLE, SIZES, 20, 0) == CompactionPlan(None, 0, 0, 0)
+    assert plan_compaction({4: 0}, SIZES, 20, 1000) == CompactionPlan(None, 0, 0, 0)
+
+
+def test_falls_back_to_static_threshold(paths: Paths):
+    config = get_config().repos['TAM']
+    logger = logging.getLogger()
+    assert compaction_threshold(paths, config, logger) == config.compaction_threshold
+
+    # No hints (or no msgpack) in the test environment
+    config = dataclasses.replace(config, compaction_max_rewrite_gb=10)
+    assert compaction_threshold(paths, config, logger) == config.compaction_threshold
+
+
+def test_read_compact_hints():
+    msgpack = pytest.importorskip('msgpack')
+    repo = Path('repo')
+    repo.mkdir()
+    for n, compact in ((5, {1: 10}), (12, {1: 10, 3: 20})):
+        with (repo / f'hints.{n}').open('wb') as f:
+            msgpack.pack({'version': 2, 'segments': {}, 'compact': compact}, f)
+    assert read_compact_hints(repo) == {1: 10, 3: 20}
@@ -0,0 +1,100 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+import yaml
+
+from shared import config
+from shared.config import (
+    Config,
+    get_config,
+    get_config_from_pk,
+    get_config_repos,
+    write_pk_snapshot,
+)
+from shared.constants import Paths
+
+
+class TestConfig:
+    def test_indexes(self):
+        cfg = get_config()
+        assert get_config_repos() == {'TAM', 'AMGS'}
+        assert [u.user for u in cfg.repo_users['TAM']] == ['TAM_2009', 'old_laptop']
+        assert [u.user for u in cfg.repo_auto_users['TAM']] == ['TAM_2009']
+        assert get_config_from_pk(cfg.users[1].pubkey) == ('AMGS', 'AMGS')
+        with pytest.raises(ValueError, match='No user with pubkey'):
+            get_config_from_pk('ssh-ed25519 asdf')
+
+    def test_cached_until_modified(self, monkeypatch):
+        path = Path('config.yml').absolute()
+        path.write_text(config.CONFIG_PATH.read_text())
+        monkeypatch.setattr(config, 'CONFIG_PATH', path)
+
+        cfg = get_config()
+        assert get_config() is cfg
+
+        path.write_text(path.read_text().replace('weekly_healthcheck: ', 'weekly_healthcheck: http://new'))
+        os.utime(path, ns=(0, 0))  # Ensure mtime changes within timestamp granularity
+        assert get_config().weekly_healthcheck.startswith('http://new')
+
+    @pytest.fixture
+    def raw_config(self):
+        return yaml.safe_load(config.CONFIG_PATH.read_text())
+
+    def test_validation(self, raw_config):
+        raw_config['users'][0]['user'] = 'TAM-2009'
+        with pytest.raises(ValueError, match='without dashes'):
+            Config.from_dict(raw_config)
+
+    def test_unknown_keys(self, raw_config):
+        raw_config['repos']['TAM']['mirror_hots'] = 'typo.example.com'
+        with pytest.raises(ValueError, match=r"Unknown keys in repos.TAM: \['mirror_hots'\]"):
+            Config.from_dict(raw_config)
+
+    def test_weeks(self, raw_config):
+        raw_config['repos']['TAM']['check_weeks'] = 8  # With either backend
+        Config.from_dict(raw_config)
+        raw_config['repos']['TAM']['check_weeks'] = 0
+        with pytest.raises(ValueError, match='check_weeks must be a positive integer'):
+            Config.from_dict(raw_config)
+
+    def test_unknown_repo(self, raw_config):
+        del raw_config['repos']['AMGS']
+        with pytest.raises(ValueError, match='unknown repo AMGS'):
+            Config.from_dict(raw_config)
+
+
+class TestPkSnapshot:
+    pk = 'ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIMji6955pM7IL2rcaCYYJOxJcdMXY3fuXmB3itcOMTCw'
+
+    def test_written_on_miss(self, monkeypatch):
+        assert not Paths.config_pk_snapshot.exists()
+        assert get_config_from_pk(self.pk) == ('AMGS', 'AMGS')
+        assert Paths.config_pk_snapshot.exists()
+
+        def raise_load(_path):
+            msg = 'Should have used the snapshot'
+            raise AssertionError(msg)
+        with monkeypatch.context() as m:
+            m.setattr(config, 'load_config', raise_load)
+            assert get_config_from_pk(self.pk) == ('AMGS', 'AMGS')
+            with pytest.raises(ValueError, match='No user with pubkey'):
+                get_config_from_pk('ssh-ed25519 asdf')
+
+    def test_concurrent_misses(self):
+        # Like the threads of the hook service
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: get_config_from_pk(self.pk), range(50)))
+        assert set(results) == {('AMGS', 'AMGS')}
+
+    def test_stale_is_ignored(self, monkeypatch):
+        path = Path('config.yml').absolute()
+        path.write_text(config.CONFIG_PATH.read_text())
+        monkeypatch.setattr(config, 'CONFIG_PATH', path)
+        write_pk_snapshot()
+
+        path.write_text(path.read_text().replace(self.pk, 'ssh-ed25519 replaced'))
+        os.utime(path, ns=(0, 0))
+        with pytest.raises(ValueError, match='No user with pubkey'):
+            get_config_from_pk(self.pk)
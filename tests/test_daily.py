@@ -0,0 +1,109 @@
+import asyncio
+import dataclasses
+import logging
+from pathlib import Path
+
+import pytest
+import requests
+
+from daily.check import weekly_check
+from daily.http_server import HttpServer
+from daily.scheduler import DeviceScheduler
+from daily.utils import gather_raise
+from shared.config import get_config
+from shared.constants import Paths
+
+
+def test_gather_raise_waits_for_all():
+    finished = []
+
+    async def fail():
+        await asyncio.sleep(0)
+        msg = 'first'
+        raise ValueError(msg)
+
+    async def slow():
+        await asyncio.sleep(0.01)
+        finished.append('slow')
+
+    with pytest.raises(ValueError, match='first'):
+        asyncio.run(gather_raise(fail(), slow()))
+    assert finished == ['slow']
+
+
+def test_http_server():
+    async def serve_and_get():
+        async with HttpServer(port=0) as server:
+            server.repo_waiting['TAM'] = 'TAM_2009'
+            port = server.server.sockets[0].getsockname()[1]
+            get = requests.Session().get
+            found = await asyncio.to_thread(get, f'http://127.0.0.1:{port}/TAM', timeout=1)
+            not_found = await asyncio.to_thread(get, f'http://127.0.0.1:{port}/AMGS', timeout=1)
+            return found, not_found
+
+    found, not_found = asyncio.run(serve_and_get())
+    assert found.status_code == 200
+    assert found.text == 'TAM_2009'
+    assert not_found.status_code == 404
+
+
+def test_device_scheduler():
+    scheduler = DeviceScheduler()
+    running = set()
+    overlaps = []
+
+    async def job(name: str, *devices: str):
+        async with scheduler.use(*devices):
+            overlaps.append((name, set(running)))
+            running.add(name)
+            await asyncio.sleep(0.01)
+            running.remove(name)
+
+    async def run_jobs():
+        await gather_raise(
+            job('TAM', 'hdd1'),
+            job('AMGS', 'hdd1'),
+            job('mirror', 'mirror', 'hdd1'),
+            job('other', 'hdd2'),
+        )
+
+    asyncio.run(run_jobs())
+    assert dict(overlaps) == {'TAM': set(), 'AMGS': set(), 'mirror': set(), 'other': {'TAM'}}
+
+
+class FakeCheckBorg:
+    def __init__(self):
+        self.calls = []
+
+    def check(self, _on_output_line, *, archives_only=False):
+        self.calls.append('archives' if archives_only else 'verify_data')
+
+    def verify_segments(self, segments):
+        self.calls.append(sorted(segments))
+        return len(segments)
+
+
+def test_rolling_check(paths: Paths):
+    config = get_config().repos['TAM']
+    borg = FakeCheckBorg()
+    weekly_check(borg, paths, config, logging.getLogger())
+    assert borg.calls == ['verify_data']
+
+    paths.repo_data = Path('data').absolute()
+    (paths.repo_data / '0').mkdir(parents=True)
+    for segment in range(1, 7):
+        (paths.repo_data / '0' / str(segment)).write_bytes(b'x')
+    (paths.repo_data / 'index.6').touch()
+
+    def verified_each_week(weeks):
+        borg = FakeCheckBorg()
+        for _ in range(weeks):
+            weekly_check(borg, paths, config, logging.getLogger())
+        return [verified for verified in borg.calls if verified != 'archives']
+
+    config = dataclasses.replace(config, check_weeks=3)
+    assert verified_each_week(3) == [[1, 2, 3, 4, 5, 6], [1, 4], [2, 5]]  # First run has no fingerprints
+
+    (paths.repo_data / '0' / '7').write_bytes(b'new')
+    (paths.repo_data / '0' / '2').write_bytes(b'changed')
+    assert verified_each_week(2) == [[2, 3, 6, 7], [1, 4, 7]]
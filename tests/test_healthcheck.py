@@ -0,0 +1,37 @@
+import requests
+
+from daily.healthcheck import Healthchecks
+
+
+class FakeResponse:
+    def raise_for_status(self):
+        pass
+
+
+def test_outbox_replay(monkeypatch):
+    sent = []
+
+    def down(_url, **_kwargs):
+        raise requests.ConnectionError
+
+    hc = Healthchecks()
+    monkeypatch.setattr(hc.session, 'post', down)
+    hc.ping('https://hc/start')
+    hc.ping('https://hc/fail', 'error')
+    hc.close()
+
+    def up(url, data, **_kwargs):
+        sent.append((url, data))
+        return FakeResponse()
+
+    hc = Healthchecks()
+    monkeypatch.setattr(hc.session, 'post', up)
+    hc.ping('https://hc/0')
+    hc.close()
+    assert sent == [('https://hc/start', None), ('https://hc/fail', 'error'), ('https://hc/0', None)]
+
+    hc = Healthchecks()
+    monkeypatch.setattr(hc.session, 'post', up)
+    hc.ping('https://hc/0')
+    hc.close()
+    assert len(sent) == 4  # Not replayed again
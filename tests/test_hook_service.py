@@ -0,0 +1,58 @@
+import time
+from threading import Event, Thread
+
+import pytest
+
+from hook import client
+from hook.server import HookServer
+from shared.constants import RC, Paths
+from shared.shell import Borg
+
+
+class TestHookService:
+    @pytest.fixture(autouse=True)
+    def server(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(Paths, 'hook_socket', tmp_path / 'hook.sock')
+        with HookServer() as server:
+            thread = Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            yield server
+            server.shutdown()
+
+    def run_client(self):
+        with pytest.raises(SystemExit) as e:
+            client.main()
+        return e.value.code
+
+    def test_forwards_rc(self, monkeypatch):
+        monkeypatch.setenv('PAM_TYPE', 'asdf')
+        assert self.run_client() == RC.invalid_usage
+
+    def test_acquire_and_release(self, monkeypatch, paths: Paths, server: HookServer):
+        monkeypatch.setattr(Borg, 'dump_arcs', lambda _self: '')
+
+        monkeypatch.setenv('PAM_TYPE', 'open_session')
+        assert self.run_client() == 0
+        assert paths.lock_user.read_text() == 'TAM_2009'
+
+        monkeypatch.setenv('PAM_TYPE', 'close_session')
+        assert self.run_client() == 0
+        assert not paths.lock.is_dir()
+
+        assert list(server.hooks) == ['TAM']
+
+    def test_timeout(self, monkeypatch, paths: Paths):
+        # borg list is stuck until the client gives up. Then the lock is released, as PAM denied the session.
+        client_gone = Event()
+        monkeypatch.setattr(Borg, 'dump_arcs', lambda _self: client_gone.wait() and '')
+        monkeypatch.setattr(client, 'TIMEOUT', 0.1)
+
+        monkeypatch.setenv('PAM_TYPE', 'open_session')
+        assert self.run_client() == RC.access_denied
+        assert paths.lock.is_dir()
+        client_gone.set()
+
+        deadline = time.monotonic() + 5
+        while paths.lock.is_dir() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not paths.lock.is_dir()
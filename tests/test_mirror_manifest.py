@@ -0,0 +1,39 @@
+import os
+from pathlib import Path
+
+from daily.mirror_manifest import MirrorManifest, local_files, plan
+from daily.segment_hashes import SegmentHashes
+from shared.constants import Paths
+
+
+def test_plan(paths: Paths):
+    snap = Path('data.snap.current')
+    (snap / '0').mkdir(parents=True)
+    (snap / '0/1').write_text('1')
+    (snap / '0/2').write_text('2')
+    files = local_files(snap, SegmentHashes(paths))
+    assert plan(files, None) == (['0/1', '0/2'], [])  # No manifest: link by name
+
+    MirrorManifest(paths).set('current', files)
+    (snap / '0/2').write_text('changed')
+    (snap / '0/3').write_text('3')
+    manifest = MirrorManifest(paths)
+    assert plan(local_files(snap, SegmentHashes(paths)), manifest.get('current')) == (['0/1'], ['0/2', '0/3'])
+
+    manifest.forget('current', ['0/1'])
+    assert plan(local_files(snap, SegmentHashes(paths)), MirrorManifest(paths).get('current'))[0] == []
+
+
+def test_plan_compares_hashes(paths: Paths):
+    snap = Path('data.snap.current')
+    (snap / '0').mkdir(parents=True)
+    (snap / '0/1').write_text('1')
+    files = local_files(snap, SegmentHashes(paths))
+    assert plan(files, {'0/1': files['0/1'][:2]}) == (['0/1'], [])  # Entry without hash
+
+    # Same size and mtime, but different content
+    st = (snap / '0/1').stat()
+    (snap / '0/1').unlink()
+    (snap / '0/1').write_text('2')
+    os.utime(snap / '0/1', ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert plan(local_files(snap, SegmentHashes(paths)), files) == ([], ['0/1'])
@@ -0,0 +1,42 @@
+import os
+import time
+from pathlib import Path
+
+import sh
+
+from shared import shell
+from shared.constants import Paths
+from shared.shell import Borg, get_passphrase
+
+
+def test_passphrase_fd(monkeypatch, paths: Paths):
+    # A fake borg that prints the passphrase it's given
+    bin_dir = Path('bin').absolute()
+    bin_dir.mkdir()
+    fake_borg = bin_dir / 'borg'
+    fake_borg.write_text('#!/bin/sh\ncat /dev/fd/$BORG_PASSPHRASE_FD\n')
+    fake_borg.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{bin_dir}{os.pathsep}{os.environ["PATH"]}')
+    monkeypatch.setattr(shell, 'sh', sh)
+
+    paths.env = Path('env').absolute()
+    paths.env.write_text("BORG_PASSPHRASE='pass phrase'\n")
+    borg = Borg(paths)
+    borg_ttl0 = Borg(paths, passphrase_ttl=0)
+    assert borg.with_lock('true') == 'pass phrase'
+
+    paths.env.write_text("BORG_PASSPHRASE='changed'\n")
+    assert borg.with_lock('true') == 'pass phrase'  # Sourced once
+    assert borg_ttl0.with_lock('true') == 'changed'
+
+
+def test_passphrase_evicted(monkeypatch):
+    monkeypatch.setattr(shell, 'sh', sh)
+    env_path = Path('env').absolute()
+    env_path.write_text("BORG_PASSPHRASE='pass phrase'\n")
+
+    assert get_passphrase(env_path, ttl=0.05) == 'pass phrase'
+    assert env_path in shell._PassphraseCache.entries  # noqa: SLF001
+    time.sleep(0.2)
+    # Dropped from memory when the TTL expires, not just re-read on the next access
+    assert env_path not in shell._PassphraseCache.entries  # noqa: SLF001
@@ -0,0 +1,136 @@
+import json
+import os
+import random
+import re
+import shutil
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+import sh
+
+from daily.prune import Archive, PrunePass, parse_archives, plan_prune, to_delete
+
+NOW = datetime(2026, 1, 1, 12).astimezone()
+PRUNE = {'keep_daily': 15, 'keep_weekly': 4, 'keep_monthly': 12, 'keep_13weekly': 4, 'keep_yearly': 2}
+
+
+def archive(name: str):
+    """'u-2025-12-30T10' -> archive of user u at that (local) time"""
+    ts = name.partition('-')[2].removesuffix('.checkpoint')
+    return Archive(name, name, datetime.fromisoformat(ts).astimezone())
+
+
+def names(archives: list[Archive]):
+    return sorted(a.name for a in archives)
+
+
+def test_parse_archives():
+    list_json = json.dumps({'archives': [{'name': 'u-1', 'id': 'ab', 'time': '2025-12-30T10:00:00.000000'}]})
+    [a] = parse_archives(list_json)
+    assert (a.name, a.id, a.ts) == ('u-1', 'ab', datetime(2025, 12, 30, 10).astimezone())
+
+
+def test_split_keeps_last_of_each_period_and_oldest():
+    archives = [archive(n) for n in ['u-2025-12-30T10', 'u-2025-12-30T20', 'u-2025-12-31T10']]
+    prune_pass = PrunePass('u-*', {'keep_daily': 2}).run(archives, NOW)
+    assert names(prune_pass.to_delete) == ['u-2025-12-30T10']
+    assert prune_pass.kept_because['u-2025-12-30T20'] == ('daily', 2)
+
+    # Not enough days, so the oldest archive is kept too, even if it's the same day as another one
+    prune_pass = PrunePass('u-*', {'keep_daily': 3}).run(archives, NOW)
+    assert names(prune_pass.to_delete) == []
+    assert prune_pass.kept_because['u-2025-12-30T10'] == ('daily[oldest]', 3)
+
+
+def test_rules_dont_count_already_kept():
+    archives = [archive(f'u-2025-12-{d:02}T10') for d in range(1, 32)]
+    prune_pass = PrunePass('u-*', {'keep_daily': 7, 'keep_weekly': 2}).run(archives, NOW)
+    # Week 2025-W52 (22-28) has its last archive kept by daily, so it isn't counted by weekly.
+    kept = set(names(archives)) - set(names(prune_pass.to_delete))
+    assert sorted(kept) == [f'u-2025-12-{d:02}T10' for d in (14, 21, 25, 26, 27, 28, 29, 30, 31)]
+    assert prune_pass.kept_because['u-2025-12-21T10'] == ('weekly', 1)
+    assert prune_pass.kept_because['u-2025-12-14T10'] == ('weekly', 2)
+
+
+def test_rules_in_borgs_order():
+    # daily goes before 13weekly, whatever the order of the options. 29-31 are in 2026-W01, 28 in 2025-W52.
+    archives = [archive(f'u-2025-12-{d}T10') for d in (28, 29, 30, 31)]
+    prune_pass = PrunePass('u-*', {'keep_13weekly': 1, 'keep_daily': 2}).run(archives, NOW)
+    assert names(prune_pass.to_delete) == ['u-2025-12-29T10']
+    assert prune_pass.kept_because['u-2025-12-30T10'] == ('daily', 2)
+    assert prune_pass.kept_because['u-2025-12-28T10'] == ('quarterly_13weekly', 1)
+
+
+def test_13weekly_week_53():
+    # 2026-12-31 is in ISO week 53 of 2026, which belongs to quarter 4 like week 52
+    archives = [archive('u-2026-12-31T10'), archive('u-2026-12-24T10'), archive('u-2026-09-20T10')]
+    prune_pass = PrunePass('u-*', {'keep_13weekly': 3}).run(archives, datetime(2027, 1, 1).astimezone())
+    assert names(prune_pass.to_delete) == ['u-2026-12-24T10']
+
+
+def test_checkpoints():
+    archives = [archive('u-2025-12-20T10'), archive('u-2025-12-30T10.checkpoint'), archive('u-2025-12-10T10.checkpoint')]
+    prune_pass = PrunePass('u-*', {'keep_daily': 10}).run(archives, NOW)
+    # The latest checkpoint is kept because it's newer than any archive
+    assert names(prune_pass.to_delete) == ['u-2025-12-10T10.checkpoint']
+
+
+def test_glob_and_other_users():
+    archives = [archive(n) for n in ['u-2025-12-29T10', 'u-2025-12-30T10', 'u-2025-12-30T20', 'u2-2025-12-30T10']]
+    prune_pass = PrunePass('u-*', {'keep_daily': 10}).run(archives, NOW)
+    assert names(prune_pass.to_delete) == ['u-2025-12-30T10']
+
+
+def test_two_passes():
+    # The example of ProcessRepo.prune's comment
+    monthly = [archive(f'u-2025-{m:02}-01T10') for m in (7, 9, 10, 11, 12)]
+    august = [archive(f'u-2025-08-{d:02}T10') for d in range(1, 11)]
+    duplicate = [archive('u-2025-12-30T10'), archive('u-2025-12-30T20')]
+    archives = monthly + august + duplicate + [archive('other-2025-08-05T10')]
+
+    passes = plan_prune(archives, ['u', 'other'], {'keep_daily': 15, 'keep_weekly': 13}, NOW)
+    assert [(p.glob, 'keep_within' in p.options) for p in passes] == [
+        ('u-*', True), ('u-*', False), ('other-*', True), ('other-*', False),
+    ]
+    deleted = set(to_delete(passes))
+    kept = set(names(archives)) - deleted
+    assert sorted(kept) == [
+        'other-2025-08-05T10',
+        'u-2025-07-01T10',
+        'u-2025-08-03T10', 'u-2025-08-10T10',
+        *names(monthly)[1:],
+        'u-2025-12-30T20',
+    ]
+    assert len(deleted) == len(to_delete(passes))  # Each archive is deleted by one pass only
+
+
+@pytest.mark.skipif(not shutil.which('borg'), reason='borg not installed')
+def test_same_as_borg(tmp_path: Path):
+    env = {
+        **os.environ,
+        'BORG_REPO': str(tmp_path / 'repo'),
+        'BORG_BASE_DIR': str(tmp_path / 'base'),
+        'BORG_PASSPHRASE': '',
+        'BORG_UNKNOWN_UNENCRYPTED_REPO_ACCESS_IS_OK': 'yes',
+    }
+    borg = sh.borg.bake(_env=env, _cwd=tmp_path)
+    borg.init(encryption='none')
+    (tmp_path / 'src').mkdir()
+
+    rnd = random.Random(0)  # noqa: S311
+    now = datetime.now().replace(microsecond=0)  # noqa: DTZ005  # borg's --timestamp is local
+    ts = now - timedelta(days=800)
+    while ts < now - timedelta(hours=1):
+        suffix = '.checkpoint' if rnd.random() < 0.05 else ''
+        borg.create(f'::u-{ts:%Y-%m-%dT%H:%M:%S}{suffix}', 'src', timestamp=f'{ts:%Y-%m-%dT%H:%M:%S}')
+        ts += timedelta(hours=rnd.choice([1, 5, 20, 30, 24 * 6, 24 * 20]))
+
+    archives = parse_archives(str(borg.list(json=True, consider_checkpoints=True)))
+    within = {**PRUNE, 'keep_within': '15d'}
+    within.pop('keep_daily')
+    for options in (PRUNE, within):
+        prune_pass = PrunePass('u-*', options).run(archives, datetime.now().astimezone())
+        output = borg.prune(glob_archives='u-*', dry_run=True, list=True, _err_to_out=True, **options)
+        would_prune = re.findall(r'^Would prune:\s+(\S+)', str(output), re.MULTILINE)
+        assert sorted(would_prune) == names(prune_pass.to_delete)
@@ -0,0 +1,75 @@
+import asyncio
+import socket
+import time
+
+from daily.main import user_messages
+from shared.constants import Paths
+from shared.pubsub import PubSub
+
+
+def test_multiple_subscribers(paths: Paths):
+    publisher = PubSub(paths, subscribe=False)
+    with PubSub(paths, subscribe=True) as sub1, PubSub(paths, subscribe=True) as sub2:
+        publisher.publish('lock_acquired user1')
+        publisher.publish('lock_released user1 1')
+        for sub in (sub1, sub2):
+            assert sub.wait_for(match='lock_acquired user1', timeout=0.1)
+            assert sub.wait_for(prefix='lock_released user1 ', timeout=0.1) == 'lock_released user1 1'
+            assert sub.wait_for(prefix='lock_released', timeout=0.01) is None
+    assert not list(paths.pubsub.iterdir())
+
+
+def test_no_subscribers(paths: Paths):
+    PubSub(paths, subscribe=False).publish('lock_acquired user1')
+
+
+def test_stale_subscriber_removed(paths: Paths):
+    paths.pubsub.mkdir()
+    stale_path = paths.pubsub / 'stale.sock'
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.bind(str(stale_path))
+    with PubSub(paths, subscribe=True) as sub:
+        PubSub(paths, subscribe=False).publish('lock_acquired user1')
+        assert sub.wait_for(match='lock_acquired user1', timeout=0.1)
+    assert not stale_path.exists()
+
+
+def test_async_wait_for(paths: Paths):
+    async def wait():
+        with PubSub(paths, subscribe=True) as sub:
+            asyncio.get_running_loop().call_later(0.01, PubSub(paths, subscribe=False).publish, 'lock_released TAM_2009 1')
+            timed_out = await sub.async_wait_for(match='lock_acquired TAM_2009', timeout=0.1)
+            PubSub(paths, subscribe=False).publish('lock_released TAM_2009 2')
+            released = await sub.async_wait_for(prefix='lock_released TAM_2009 ', timeout=0.1)
+            return timed_out, released
+
+    assert asyncio.run(wait()) == (None, 'lock_released TAM_2009 2')
+
+
+def test_drains_while_not_waiting(paths: Paths):
+    """More messages than the kernel queues (net.unix.max_dgram_qlen) arrive before they're awaited."""
+    def publish_many():
+        publisher = PubSub(paths, subscribe=False)
+        for i in range(50):
+            assert publisher.publish(f'lock_released TAM_2009 {i}') == []
+            time.sleep(0.001)
+
+    async def wait():
+        with PubSub(paths, subscribe=True) as sub:
+            await asyncio.to_thread(publish_many)
+            return [await sub.async_wait_for(prefix='lock_released ', timeout=0.1) for _ in range(50)]
+
+    assert asyncio.run(wait()) == [f'lock_released TAM_2009 {i}' for i in range(50)]
+
+
+def test_keeps_only_user_messages(paths: Paths):
+    async def wait():
+        with PubSub(paths, subscribe=True, keep=user_messages('AMGS')) as sub:
+            publisher = PubSub(paths, subscribe=False)
+            for _ in range(20):
+                await asyncio.to_thread(publisher.publish, 'lock_denied TAM_2009')
+            await asyncio.to_thread(publisher.publish, 'lock_acquired AMGS')
+            acquired = await sub.async_wait_for(match='lock_acquired AMGS', timeout=0.1)
+            return acquired, list(sub.pending)
+
+    assert asyncio.run(wait()) == ('lock_acquired AMGS', [])
@@ -1,7 +1,7 @@
 import pytest
 
 from hook.main import Hook, main
-from hook.utils import BadRepoError, arcs2str
+from hook.utils import BadRepoError, arcs2str, arcs_digest, without_user_temp
 from shared import config
 from shared.constants import RC, Paths
 from shared.shell import Borg
@@ -48,7 +48,7 @@ class TestReleaseLock:
         monkeypatch.setattr(config, 'get_config_from_pk', lambda _: ('TAM', 'user1'))
 
     def write_prev_arcs(self, paths: Paths, arcs):
-        paths.lock_prev_arcs.write_text(arcs2str(arcs))
+        paths.lock_prev_digest.write_text(arcs_digest(without_user_temp(arcs, 'user1')))
 
     def check_repo(self):
         hook = Hook('TAM')
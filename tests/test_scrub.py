@@ -0,0 +1,18 @@
+from daily.scrub import MirrorScrub
+from shared.constants import Paths
+
+
+def test_rotation(paths: Paths):
+    files = [f'0/{i}' for i in range(1, 7)]
+
+    def scrub_week(rel_paths):
+        scrub = MirrorScrub(paths, 3)
+        selected = scrub.select(rel_paths)
+        scrub.done(selected)
+        return selected
+
+    assert scrub_week(files) == files  # First run
+    assert scrub_week(files) == ['0/1', '0/4']
+    files += ['0/7', '1/8', 'README']
+    assert scrub_week(files) == ['0/2', '0/5', '0/7', '1/8', 'README']  # Plus new ones
+    assert scrub_week(files) == ['0/3', '0/6', 'README']
@@ -0,0 +1,28 @@
+import shutil
+from pathlib import Path
+
+from daily.segment_hashes import SegmentHashes
+from mirror_server.verify_hashes import verify_hashes
+from shared.constants import Paths
+
+
+def test_hashed_once(paths: Paths):
+    snap = Path('data.snap.checked')
+    (snap / '0').mkdir(parents=True)
+    (snap / '0/1').write_text('1')
+    (snap / '0/2').write_text('2')
+
+    index = SegmentHashes(paths)
+    hashes = index.get(snap, ['0/1', '0/2'])
+    index.save(['0/1', '0/2'])
+    assert index.hashed == 2
+
+    (snap / '0/2').write_text('changed')
+    index = SegmentHashes(paths)
+    assert index.get(snap, ['0/1', '0/2'])['0/1'] == hashes['0/1']
+    assert index.hashed == 1
+
+    mirror = Path('current')
+    shutil.copytree(snap, mirror)
+    (mirror / '0/1').write_text('bitrot')
+    assert verify_hashes(mirror, {**hashes, '0/3': 'missing'}) == ['0/1', '0/2']
@@ -0,0 +1,36 @@
+from pathlib import Path
+
+from daily import smarthealthc
+
+DISK = '/dev/disk/by-id/ata-TEST'
+PASSED = {'json_format_version': [1, 0], 'smart_status': {'passed': True}}
+FAILED = {'json_format_version': [1, 0], 'smart_status': {'passed': False}}
+STANDBY = {
+    'json_format_version': [1, 0],
+    'smartctl': {'messages': [{'string': 'Device is in STANDBY mode, exit(2)', 'severity': 'information'}]},
+}
+
+
+def test_standby_uses_cache(monkeypatch):
+    monkeypatch.setattr(Path, 'is_block_device', lambda _self: True)
+    calls = []
+
+    def fake_smartctl(outputs):
+        def smartctl(_disk, *, standby):
+            calls.append(standby)
+            return outputs[standby]
+        monkeypatch.setattr(smarthealthc, 'smartctl', smartctl)
+
+    cache = {}
+    fake_smartctl({False: FAILED, True: STANDBY})
+    assert smarthealthc.process_disk(DISK, cache)[0] == 'fail'  # Nothing cached, so it's woken up
+    assert smarthealthc.process_disk(DISK, cache)[0] == 'fail'  # Cached, and still in standby
+    assert calls == [False, True]
+
+    fake_smartctl({True: PASSED})
+    assert smarthealthc.process_disk(DISK, cache) == ('0', None)  # Awake
+    assert cache[DISK]['action'] == '0'
+
+    cache[DISK]['time'] -= 8 * 24 * 3600
+    fake_smartctl({False: FAILED})
+    assert smarthealthc.process_disk(DISK, cache)[0] == 'fail'  # Too old, so it's woken up
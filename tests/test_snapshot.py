@@ -0,0 +1,25 @@
+from pathlib import Path
+
+from daily.snapshot import update_snapshot
+
+
+def test_update_snapshot():
+    data = Path('data')
+    snap = Path('data.snap.current')
+    (data / '0').mkdir(parents=True)
+    for name in ('0/1', '0/2', 'index.2'):
+        (data / name).write_text(name)
+
+    stats = update_snapshot(data, snap)
+    assert (stats.linked, stats.kept, stats.removed) == (3, 0, 0)
+    assert (snap / '0/1').samefile(data / '0/1')
+
+    (data / '1').mkdir()
+    (data / '1/3').write_text('3')
+    (data / '0/1').unlink()
+    (data / 'index.2').rename(data / 'index.3')
+
+    stats = update_snapshot(data, snap)
+    assert (stats.linked, stats.kept, stats.removed) == (2, 1, 2)
+    assert sorted(str(p.relative_to(snap)) for p in snap.rglob('*')) == ['0', '0/2', '1', '1/3', 'index.3']
+    assert (snap / '1/3').samefile(data / '1/3')
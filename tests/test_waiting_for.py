@@ -0,0 +1,25 @@
+import json
+import os
+
+from shared.constants import Paths
+from shared.waiting_for import process_token, read_waiting_for, write_waiting_for
+
+
+def test_waiting_for(paths: Paths):
+    assert read_waiting_for(paths) is None
+    write_waiting_for(paths, 'TAM_2009')
+    assert read_waiting_for(paths) == 'TAM_2009'
+    write_waiting_for(paths, None)
+    assert read_waiting_for(paths) is None
+
+
+def test_stale_is_ignored(paths: Paths):
+    token = process_token(os.getpid())
+    boot_id, pid, start_time = token.split(' ')
+    for stale in (f'{boot_id} {pid} {int(start_time) - 1}', f'other-boot {pid} {start_time}', f'{boot_id} 999999999 1'):
+        paths.waiting_for.write_text(json.dumps({'token': stale, 'user': 'TAM_2009'}))
+        assert read_waiting_for(paths) is None
+    for garbage in ('garbage', '[]', '"str"', '{}', '{"token": "x", "user": "u"}', '{"token": 1, "user": "u"}',
+                    '{"token": "a b", "user": "u"}', f'{{"token": "{token}", "user": null}}'):
+        paths.waiting_for.write_text(garbage)
+        assert read_waiting_for(paths) is None, garbage
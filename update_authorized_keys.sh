@@ -10,3 +10,7 @@ poetry -q run \
   ansible-playbook \
   --inventory localhost, --limit localhost \
   playbooks/update_ak.yml
+
+# Compile the hook's pubkey lookup:
+cd ..
+poetry -q run python -m shared.config